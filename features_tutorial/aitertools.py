@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# motivation.py builds up a toolkit of generators: squares(), pairwise(),
+#   contiguous(), to_ranges(), and my_zip(), my_map(), my_filter()
+# when the data come from the network, the source is an async iterator,
+#   and iterating it with a plain `for' would mean blocking the event
+#   loop on every element
+# here are the same helpers as async generators, plus async versions
+#   of tee() and groupby(), and a merge() of several sources that
+#   yields values in the order they arrive
+
+import asyncio
+from collections import deque
+from inspect import isawaitable
+
+# wrap a plain iterable so it can go anywhere an async iterable can
+async def aiterate( iterable ):
+	for x in iterable:
+		yield x
+
+def _aiter( iterable ):
+	if hasattr( iterable, '__aiter__' ):
+		return iterable.__aiter__()
+	return aiterate( iterable ).__aiter__()
+
+_exhausted = object()
+async def _anext( it ):
+	try:
+		return await it.__anext__()
+	except StopAsyncIteration:
+		return _exhausted
+
+# the toolkit from motivation.py
+
+async def squares( iterable ):
+	async for x in _aiter( iterable ):
+		yield x, x**2
+
+async def pairwise( iterable, n ):
+	'''yield each run of n consecutive values as a tuple'''
+	window = deque( maxlen=n )
+	async for x in _aiter( iterable ):
+		window.append( x )
+		if len(window) == n:
+			yield tuple( window )
+
+async def contiguous( iterable ):
+	buffer = []
+	async for x in _aiter( iterable ):
+		if buffer and x - buffer[-1] > 1:
+			yield buffer
+			buffer = []
+		buffer.append( x )
+	if buffer:
+		yield buffer
+
+async def to_ranges( iterable ):
+	async for subset in contiguous( iterable ):
+		yield '%d' % subset[0] \
+		       if len(subset) == 1 else \
+		       '%d-%d' % (subset[0], subset[-1])
+
+async def my_zip( *iterables ):
+	its = [_aiter(x) for x in iterables]
+	while its:
+		values = []
+		for it in its:
+			x = await _anext( it )
+			if x is _exhausted:
+				return
+			values.append( x )
+		yield tuple( values )
+
+# func may be a plain function or a coroutine function
+async def my_map( func, *iterables ):
+	async for args in my_zip( *iterables ):
+		rv = func( *args )
+		yield (await rv) if isawaitable( rv ) else rv
+
+async def my_filter( pred, iterable ):
+	pred = bool if pred is None else pred
+	async for x in _aiter( iterable ):
+		rv = pred( x )
+		if (await rv) if isawaitable( rv ) else rv:
+			yield x
+
+# TEE
+
+# like itertools.tee(), each of the n iterators gets every value, and
+#   values are buffered until the slowest iterator has seen them
+# the lock makes sure only one branch at a time waits on the source
+def tee( iterable, n=2 ):
+	it, lock = _aiter( iterable ), asyncio.Lock()
+	buffers = [deque() for _ in range(n)]
+	async def branch( buffer ):
+		while True:
+			if not buffer:
+				async with lock:
+					if not buffer:  # another branch may have filled it
+						x = await _anext( it )
+						if x is _exhausted:
+							return
+						for b in buffers:
+							b.append( x )
+			yield buffer.popleft()
+	return tuple( branch(b) for b in buffers )
+
+# GROUPBY
+
+# like itertools.groupby(), this yields (key, group) pairs, where each
+#   group is itself an async iterator that shares the source: moving on
+#   to the next group skips whatever is left of the current one
+class groupby( object ):
+	'''groupby(aiterable, key) groups consecutive values with the same key'''
+	def __init__( self, iterable, key=None ):
+		self.it = _aiter( iterable )
+		self.key = (lambda x: x) if key is None else key
+		self.current = self.current_key = self.target_key = _exhausted
+		self.id = object()
+	def __aiter__( self ):
+		return self
+	async def __anext__( self ):
+		self.id = object()
+		while self.current_key is _exhausted or self.current_key == self.target_key:
+			await self._step()
+		self.target_key = self.current_key
+		return self.current_key, self._group( self.target_key, self.id )
+	async def _step( self ):
+		x = await _anext( self.it )
+		if x is _exhausted:
+			raise StopAsyncIteration
+		self.current, self.current_key = x, self.key( x )
+	async def _group( self, key, id ):
+		while self.id is id and self.current_key == key:
+			yield self.current
+			try:
+				await self._step()
+			except StopAsyncIteration:
+				return
+
+# MERGE
+
+# values from several sources, in whatever order they become available
+# each source is drained by its own task into a bounded queue, so a fast
+#   source can't run arbitrarily far ahead of the consumer
+# when the consumer stops early the tasks are cancelled, usually while
+#   waiting on a full queue that nobody will read again, so a cancelled
+#   task mustn't wait on the queue to say it's done: it just closes its
+#   source and goes, and merge() waits for all of them to have gone
+async def merge( *iterables, maxsize=64 ):
+	queue, done = asyncio.Queue( maxsize ), object()
+	async def drain( iterable ):
+		it = _aiter( iterable )
+		try:
+			async for x in it:
+				await queue.put( (None, x) )
+			last = None, done
+		except Exception as e:
+			last = e, None
+		finally:
+			aclose = getattr( it, 'aclose', None )
+			if aclose is not None:
+				await aclose()
+		await queue.put( last )
+	tasks = [asyncio.ensure_future( drain(x) ) for x in iterables]
+	try:
+		remaining = len( tasks )
+		while remaining:
+			error, x = await queue.get()
+			if error is not None:
+				raise error
+			if x is done:
+				remaining -= 1
+			else:
+				yield x
+	finally:
+		for task in tasks:
+			task.cancel()
+		await asyncio.gather( *tasks, return_exceptions=True )
+
+if __name__ == '__main__':
+	async def collect( aiterable ):
+		return [x async for x in aiterable]
+
+	async def slowly( iterable, delay ):
+		for x in iterable:
+			await asyncio.sleep( delay )
+			yield x
+
+	async def main():
+		assert await collect( squares(range(4)) ) == [(0,0),(1,1),(2,4),(3,9)]
+		assert await collect( pairwise('abcd', 2) ) == \
+		       [('a','b'),('b','c'),('c','d')]
+		assert await collect( contiguous([1,2,3,5,10,11,12,17]) ) == \
+		       [[1,2,3],[5],[10,11,12],[17]]
+		assert await collect( to_ranges(slowly([1,2,3,5,10,11,12,17], 0)) ) == \
+		       ['1-3','5','10-12','17']
+		assert await collect( my_zip(range(5), 'abc') ) == \
+		       [(0,'a'),(1,'b'),(2,'c')]
+		async def add( x, y ):
+			return x + y
+		assert await collect( my_map(add, range(3), range(3)) ) == [0, 2, 4]
+		assert await collect( my_filter(None, [0, 1, '', 'a']) ) == [1, 'a']
+
+		a, b = tee( slowly(range(5), 0) )
+		assert await collect( a ) == await collect( b ) == [0,1,2,3,4]
+		a, b = tee( slowly(range(5), 0) )
+		assert await asyncio.gather( collect(a), collect(b) ) == \
+		       [[0,1,2,3,4], [0,1,2,3,4]]
+
+		groups = []
+		async for key, group in groupby( 'aaabccdd' ):
+			groups.append( (key, ''.join(await collect(group))) )
+		assert groups == [('a','aaa'), ('b','b'), ('c','cc'), ('d','dd')]
+		keys = [k async for k, _ in groupby('aaabccdd')]
+		assert keys == ['a', 'b', 'c', 'd']
+
+		merged = await collect( merge(slowly('abc', .01), slowly('xyz', .015)) )
+		assert sorted( merged ) == list( 'abcxyz' )
+		assert merged.index( 'a' ) < merged.index( 'x' )
+
+		# stopping early leaves no task (or source) behind
+		closed = []
+		async def endless( name ):
+			try:
+				while True:
+					yield name
+					await asyncio.sleep( 0 )
+			finally:
+				closed.append( name )
+		merged = merge( endless('a'), endless('b'), maxsize=2 )
+		async for x in merged:
+			break
+		await merged.aclose()
+		assert sorted( closed ) == [ 'a', 'b' ]
+		assert asyncio.all_tasks() == { asyncio.current_task() }
+
+	asyncio.run( main() )
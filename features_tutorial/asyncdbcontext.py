@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# the context managers in dbcontext.py all block: while SQLite is
+#   reading pages, nothing else on the thread can run
+# inside an asyncio event loop, that means every other coroutine
+#   stalls for the duration of the query
+
+# sqlite3 has no asynchronous API, so we give each connection its own
+#   worker thread with a request queue (a single-worker executor is
+#   exactly that) and await the results
+# since the connection is only ever touched by its own thread,
+#   sqlite3's check_same_thread safety check stays on
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from sqlite3 import connect, OperationalError
+
+class AsyncConnection( object ):
+	'''AsyncConnection(*args) runs a sqlite3 connection on its own thread'''
+	def __init__( self, *args, **kwargs ):
+		self.args, self.kwargs = args, kwargs
+		self._executor = ThreadPoolExecutor( max_workers=1,
+		                                     thread_name_prefix='sqlite' )
+		self._conn = None
+
+	# run func(*args) on the connection's thread
+	def _run( self, func, *args ):
+		loop = asyncio.get_running_loop()
+		return loop.run_in_executor( self._executor, partial(func, *args) )
+
+	async def open( self ):
+		if self._conn is None:
+			self._conn = await self._run( partial(connect, *self.args,
+			                                      **self.kwargs) )
+		return self
+
+	async def execute( self, sql, params=() ):
+		'''execute a statement, returning an AsyncCursor'''
+		cursor = await self.cursor()
+		await cursor.execute( sql, params )
+		return cursor
+	async def executemany( self, sql, seq_of_params ):
+		cursor = await self.cursor()
+		await cursor.executemany( sql, seq_of_params )
+		return cursor
+	async def cursor( self ):
+		return AsyncCursor( self, await self._run(self._conn.cursor) )
+	async def commit( self ):
+		await self._run( self._conn.commit )
+	async def rollback( self ):
+		await self._run( self._conn.rollback )
+	async def close( self ):
+		if self._conn is not None:
+			await self._run( self._conn.close )
+			self._conn = None
+		self._executor.shutdown( wait=False )
+
+	# like sqlite3's own connection context manager: commit on success,
+	#   rollback on error
+	async def __aenter__( self ):
+		return self
+	async def __aexit__( self, type, value, traceback ):
+		if type is None:
+			await self.commit()
+		else:
+			await self.rollback()
+
+class AsyncCursor( object ):
+	'''AsyncCursor(conn, cursor) awaits a sqlite3 cursor on its connection's thread'''
+	def __init__( self, conn, cursor, arraysize=1024 ):
+		self.conn, self._cursor = conn, cursor
+		cursor.arraysize = arraysize
+	@property
+	def arraysize( self ):
+		return self._cursor.arraysize
+	@arraysize.setter
+	def arraysize( self, n ):
+		self._cursor.arraysize = n
+	@property
+	def rowcount( self ):
+		return self._cursor.rowcount
+	@property
+	def lastrowid( self ):
+		return self._cursor.lastrowid
+
+	async def execute( self, sql, params=() ):
+		await self.conn._run( self._cursor.execute, sql, params )
+		return self
+	async def executemany( self, sql, seq_of_params ):
+		await self.conn._run( self._cursor.executemany, sql, seq_of_params )
+		return self
+	async def fetchone( self ):
+		return await self.conn._run( self._cursor.fetchone )
+	async def fetchmany( self, size=None ):
+		return await self.conn._run( self._cursor.fetchmany,
+		                             size or self._cursor.arraysize )
+	async def fetchall( self ):
+		return await self.conn._run( self._cursor.fetchall )
+	async def close( self ):
+		await self.conn._run( self._cursor.close )
+
+	# each trip to the worker thread costs a context switch, so we hop
+	#   over once per batch of rows, not once per row
+	async def batches( self, size=None ):
+		'''yield lists of rows, fetched arraysize rows at a time'''
+		while True:
+			rows = await self.fetchmany( size )
+			if not rows:
+				return
+			yield rows
+	async def __aiter__( self ):
+		async for rows in self.batches():
+			for row in rows:
+				yield row
+
+# the same shape as connectioncontext() and cursorcontext()
+@asynccontextmanager
+async def asyncconnectioncontext( *args, **kwargs ):
+	conn = await AsyncConnection( *args, **kwargs ).open()
+	try:
+		async with conn:
+			yield conn
+	finally:
+		await conn.close()
+
+@asynccontextmanager
+async def asynccursorcontext( conn, arraysize=1024 ):
+	cursor = await conn.cursor()
+	cursor.arraysize = arraysize
+	try:
+		yield cursor
+	finally:
+		await cursor.close()
+
+# SHARING CONNECTIONS
+
+# thousands of coroutines shouldn't each open a connection (and a
+#   thread); instead, they check one of a handful of connections out
+#   for the duration of an `async with` block
+# each checkout is its own transaction, so coroutines never see each
+#   other's half-finished work
+
+# close() closes the idle connections straight away; one that's checked
+#   out is closed when its `async with' block ends, and coroutines still
+#   waiting for a connection get an error instead of waiting forever
+class AsyncConnectionPool( object ):
+	'''AsyncConnectionPool(*args, size=...) shares a few AsyncConnections between coroutines'''
+	def __init__( self, *args, size=2, **kwargs ):
+		if size < 1:
+			raise ValueError( 'size must be at least 1' )
+		self.args, self.kwargs, self.size = args, kwargs, size
+		self._idle = None
+		self._all = []              # open connections
+		self._busy = set()          # checked out
+		self._closed = False
+
+	async def open( self ):
+		if self._closed:
+			raise OperationalError( 'connection pool is closed' )
+		if self._idle is None:
+			self._idle = asyncio.Queue()
+			for _ in range(self.size):
+				conn = await AsyncConnection( *self.args, **self.kwargs ).open()
+				self._all.append( conn )
+				self._idle.put_nowait( conn )
+		return self
+
+	@asynccontextmanager
+	async def connection( self ):
+		await self.open()
+		conn = await self._idle.get()
+		if conn is None:
+			# closed while we waited: pass the news on to the next waiter
+			self._idle.put_nowait( None )
+			raise OperationalError( 'connection pool is closed' )
+		self._busy.add( conn )
+		try:
+			async with conn:
+				yield conn
+		finally:
+			self._busy.discard( conn )
+			if self._closed:
+				self._all.remove( conn )
+				await conn.close()
+			else:
+				self._idle.put_nowait( conn )
+
+	async def close( self ):
+		if self._closed:
+			return
+		self._closed = True
+		if self._idle is not None:
+			while not self._idle.empty():
+				await self._idle.get_nowait().close()
+			self._idle.put_nowait( None )
+		self._all = [ conn for conn in self._all if conn in self._busy ]
+
+	async def __aenter__( self ):
+		return await self.open()
+	async def __aexit__( self, type, value, traceback ):
+		await self.close()
+
+if __name__ == '__main__':
+	from os import remove
+	from tempfile import mkstemp
+
+	_, filename = mkstemp( suffix='.db' )
+
+	async def setup():
+		async with asyncconnectioncontext( filename ) as conn, \
+		           asynccursorcontext( conn ) as cur:
+			await cur.execute( 'CREATE TABLE employees (name text, salary real)' )
+			await cur.executemany( 'INSERT INTO employees VALUES (?, ?)',
+			                       ((str(i), i) for i in range(10000)) )
+
+	async def total( pool ):
+		async with pool.connection() as conn:
+			cur = await conn.execute( 'SELECT salary FROM employees' )
+			return sum( [r[0] async for r in cur] )
+
+	# while the queries run, the event loop keeps ticking
+	async def ticker( stop ):
+		ticks = 0
+		while not stop.is_set():
+			ticks += 1
+			await asyncio.sleep( 0 )
+		return ticks
+
+	async def main():
+		await setup()
+		async with AsyncConnectionPool( filename, size=2 ) as pool:
+			stop = asyncio.Event()
+			ticks = asyncio.create_task( ticker(stop) )
+			totals = await asyncio.gather( *(total(pool) for _ in range(20)) )
+			stop.set()
+			assert set( totals ) == { sum(range(10000)) }
+			assert await ticks > 0
+			assert len( pool._all ) == 2
+			async with pool.connection() as conn:
+				cur = await conn.execute( 'SELECT name FROM employees' )
+				batches = [len(rows) async for rows in cur.batches(4096)]
+				assert batches == [4096, 4096, 1808]
+
+		# closing a pool with a connection checked out: it's closed when
+		#   it comes back, waiters are told, and the pool stays closed
+		pool = await AsyncConnectionPool( filename, size=1 ).open()
+		checked_out, closed = asyncio.Event(), asyncio.Event()
+		async def holder():
+			async with pool.connection() as conn:
+				checked_out.set()
+				await closed.wait()
+				return ( await (await conn.execute(select)).fetchone() )[0]
+		async def waiter():
+			async with pool.connection():
+				pass
+		select = 'SELECT count(*) FROM employees'
+		held = asyncio.create_task( holder() )
+		await checked_out.wait()
+		waiting = asyncio.create_task( waiter() )
+		await asyncio.sleep( 0 )
+		await pool.close()
+		closed.set()
+		assert await held == 10000
+		try:
+			await waiting
+		except OperationalError:
+			pass
+		else:
+			assert False
+		assert not pool._busy and pool._all == []
+		try:
+			async with pool.connection():
+				pass
+		except OperationalError:
+			pass
+		else:
+			assert False
+
+	asyncio.run( main() )
+	remove( filename )
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# notes.md has a generator that accumulates data before sending a packet:
+#   def router(iterable, packet_size):
+#       for datum in iterable:
+#           packet.append(datum)
+#           if len(packet) == packet_size:
+#               yield packet
+#               packet = []
+# it only flushes on a full packet, so the last partial packet is lost,
+#   and on a quiet stream a datum can sit in a half-full packet forever
+
+# for telemetry we want to flush when any of these happens:
+#   1. the packet holds packet_size items
+#   2. the packet holds max_bytes bytes (as measured by sizeof)
+#   3. the oldest item in the packet has waited max_latency seconds
+# and we always flush whatever is left at the end
+
+# the flushing rules live in one small class, so that the plain
+#   generator, the queue-driven generator, and the asyncio version
+#   all behave the same way
+
+from time import monotonic
+
+class Batcher( object ):
+	'''Batcher(packet_size, max_bytes, max_latency) decides when to flush a packet'''
+	def __init__( self, packet_size, max_bytes=None, max_latency=None,
+	              sizeof=len, reuse=False ):
+		if packet_size < 1:
+			raise ValueError( 'packet_size must be at least 1' )
+		self.packet_size, self.max_bytes, self.max_latency = \
+		  packet_size, max_bytes, max_latency
+		self.sizeof, self.reuse = sizeof, reuse
+		# the buffer is allocated once and filled by index, rather than
+		#   growing a new list with append() for every packet
+		self._buffer = [None] * packet_size
+		self._n, self._bytes, self._deadline = 0, 0, None
+
+	def __len__( self ):
+		return self._n
+
+	def remaining( self ):
+		'''seconds until the current packet is due, or None if there is no deadline'''
+		if self._deadline is None:
+			return None
+		return max( 0., self._deadline - monotonic() )
+
+	def due( self ):
+		return self._deadline is not None and monotonic() >= self._deadline
+
+	# with reuse=True, a full packet is the buffer itself: it is only
+	#   valid until the next call to add()
+	# partial packets (flushed on bytes, time, or at the end) are
+	#   always copies
+	def flush( self ):
+		'''return the current packet (or None if empty) and start a new one'''
+		n = self._n
+		if not n:
+			return None
+		buffer = self._buffer
+		if n == self.packet_size:
+			packet = buffer if self.reuse else buffer[:]
+		else:
+			packet = buffer[:n]
+		if not self.reuse or n < self.packet_size:
+			buffer[:n] = [None] * n  # don't keep references alive
+		self._n, self._bytes, self._deadline = 0, 0, None
+		return packet
+
+	def add( self, datum ):
+		'''add a datum, returning a packet if one is now due, else None'''
+		n = self._n
+		if not n and self.max_latency is not None:
+			self._deadline = monotonic() + self.max_latency
+		self._buffer[ n ] = datum
+		self._n = n = n + 1
+		if self.max_bytes is not None:
+			self._bytes += self.sizeof( datum )
+			if self._bytes >= self.max_bytes:
+				return self.flush()
+		if n == self.packet_size or self.due():
+			return self.flush()
+		return None
+
+# with a plain iterable, we can only look at the clock when a datum
+#   arrives: if the source goes quiet, a packet can't be flushed until
+#   the next datum (or the end)
+from itertools import islice
+def router( iterable, packet_size, max_bytes=None, max_latency=None,
+            sizeof=len, reuse=False ):
+	if max_bytes is None and max_latency is None:
+		# flushing on count alone is just slicing, which islice()
+		#   does without running any Python code per datum
+		it, buffer = iter( iterable ), []
+		while True:
+			if reuse:
+				buffer[:] = islice( it, packet_size )
+				packet = buffer if len(buffer) == packet_size else buffer[:]
+			else:
+				packet = list( islice(it, packet_size) )
+			if not packet:
+				return
+			yield packet
+	batcher = Batcher( packet_size, max_bytes, max_latency, sizeof, reuse )
+	add = batcher.add
+	for datum in iterable:
+		packet = add( datum )
+		if packet is not None:
+			yield packet
+	packet = batcher.flush()
+	if packet is not None:
+		yield packet
+
+# if the data arrive on a queue.Queue, we can wait on the queue with a
+#   timeout, which gives a real bound on how long a datum waits
+# put `sentinel` on the queue to end the stream
+from queue import Empty
+def queuerouter( queue, packet_size, max_bytes=None, max_latency=None,
+                 sizeof=len, reuse=False, sentinel=None ):
+	batcher = Batcher( packet_size, max_bytes, max_latency, sizeof, reuse )
+	while True:
+		try:
+			datum = queue.get( timeout=batcher.remaining() )
+		except Empty:
+			yield batcher.flush()
+			continue
+		if datum is sentinel:
+			break
+		packet = batcher.add( datum )
+		if packet is not None:
+			yield packet
+	packet = batcher.flush()
+	if packet is not None:
+		yield packet
+
+# the asyncio version: an async iterable in, packets out
+# we can't time out an __anext__() without cancelling (and so closing)
+#   an async generator source, so a helper task copies the source
+#   into an asyncio.Queue and we wait on that instead
+import asyncio
+async def arouter( aiterable, packet_size, max_bytes=None, max_latency=None,
+                   sizeof=len, reuse=False ):
+	batcher = Batcher( packet_size, max_bytes, max_latency, sizeof, reuse )
+	queue, done = asyncio.Queue( packet_size ), object()
+	# (if we stop early, pump() is cancelled, most likely while waiting on
+	#   a full queue, so it only says it's done when it hasn't been)
+	async def pump():
+		try:
+			async for datum in aiterable:
+				await queue.put( datum )
+		except Exception:
+			await queue.put( done )
+			raise
+		finally:
+			aclose = getattr( aiterable, 'aclose', None )
+			if aclose is not None:
+				await aclose()
+		await queue.put( done )
+	task = asyncio.ensure_future( pump() )
+	try:
+		while True:
+			try:
+				datum = await asyncio.wait_for( queue.get(), batcher.remaining() )
+			except asyncio.TimeoutError:
+				yield batcher.flush()
+				continue
+			if datum is done:
+				break
+			packet = batcher.add( datum )
+			if packet is not None:
+				yield packet
+		packet = batcher.flush()
+		if packet is not None:
+			yield packet
+		await task  # re-raise any error from the source
+	finally:
+		task.cancel()
+		await asyncio.gather( task, return_exceptions=True )
+
+if __name__ == '__main__':
+	from queue import Queue
+	from threading import Thread
+	from time import sleep
+
+	# flush on count, and keep the tail
+	assert list(router(range(7), 3)) == [[0,1,2],[3,4,5],[6]]
+
+	# flush on bytes
+	words = [b'aa', b'bbbb', b'c', b'dddddd', b'e']
+	assert list(router(words, 10, max_bytes=6)) == \
+	       [[b'aa', b'bbbb'], [b'c', b'dddddd'], [b'e']]
+
+	# with reuse=True, full packets are the same list every time
+	packets = [id(p) for p in router(range(9), 3, reuse=True)]
+	assert len(set(packets)) == 1
+
+	# flush on time, even while the source is quiet
+	q = Queue()
+	def produce():
+		for x in range(3):
+			q.put( x )
+		sleep( .2 )
+		q.put( 3 )
+		q.put( None )
+	Thread( target=produce ).start()
+	start = monotonic()
+	first = next( queuerouter(q, 100, max_latency=.05) )
+	assert first == [0,1,2] and monotonic() - start < .15
+
+	async def source():
+		for x in range(3):
+			yield x
+		await asyncio.sleep( .2 )
+		yield 3
+	async def main():
+		start, packets = monotonic(), []
+		async for packet in arouter( source(), 100, max_latency=.05 ):
+			packets.append( (packet, monotonic() - start) )
+		assert [p for p, _ in packets] == [[0,1,2], [3]]
+		assert packets[0][1] < .15
+
+		# stopping early closes the source and leaves no task behind
+		closed = []
+		async def endless():
+			try:
+				while True:
+					yield 0
+					await asyncio.sleep( 0 )
+			finally:
+				closed.append( True )
+		packets = arouter( endless(), 2 )
+		async for packet in packets:
+			break
+		await packets.aclose()
+		assert closed and asyncio.all_tasks() == { asyncio.current_task() }
+	asyncio.run( main() )
+
+	# BENCHMARK
+	from timeit import timeit
+	def notes_router( iterable, packet_size ):
+		packet = []
+		for datum in iterable:
+			packet.append( datum )
+			if len(packet) == packet_size:
+				yield packet
+				packet = []
+	data = range(1000000)
+	print( 'notes.md router: %.3fs' % timeit(
+	         lambda: sum(len(p) for p in notes_router(data, 64)), number=1) )
+	print( 'router:          %.3fs' % timeit(
+	         lambda: sum(len(p) for p in router(data, 64)), number=1) )
+	print( 'router (reuse):  %.3fs' % timeit(
+	         lambda: sum(len(p) for p in router(data, 64, reuse=True)), number=1) )
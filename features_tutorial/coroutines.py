@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# syntax.py shows that we can .send() values into a generator,
+#   .throw() exceptions into it, and .close() it
+# put together, these let us build pipelines that run the other way
+#   around from generator chains: instead of the last stage pulling
+#   values through the pipeline with next(), the source pushes values
+#   in with .send()
+# push-based pipelines can branch (one value goes to many consumers),
+#   which pull-based generator chains can't do without tee()
+
+# every stage here follows the same rules:
+#   1. it is primed automatically, so it can be sent to straight away
+#   2. an exception thrown into it is passed downstream with .throw(),
+#      so errors travel along the same path as the data, until some
+#      stage handles them (or they come back out to the sender)
+#   3. closing it closes everything downstream, flushing any buffers
+#   4. with batched=True, each .send() carries a list of values, so each
+#      generator is resumed once per batch rather than once per value
+# (pushing is for the shapes pulling can't do, not for speed: every
+#   value still costs a Python call per stage: in the benchmark below,
+#   batched push is about a fifth faster than unbatched push and close
+#   to a pull chain calling the same functions, while generator
+#   expressions, which make no calls at all, are about twice as fast)
+
+from functools import wraps
+from itertools import islice
+
+def coroutine( func ):
+	'''coroutine adds automatic priming to a generator function'''
+	@wraps( func )
+	def start( *args, **kwargs ):
+		gen = func( *args, **kwargs )
+		next( gen )
+		return gen
+	return start
+
+@coroutine
+def transform( func, target, batched=False ):
+	'''send func(x) downstream for every x'''
+	try:
+		while True:
+			try:
+				item = (yield)
+			except GeneratorExit:
+				raise
+			except Exception as e:
+				target.throw( e )
+				continue
+			target.send( list(map(func, item)) if batched else func(item) )
+	finally:
+		target.close()
+
+@coroutine
+def select( pred, target, batched=False ):
+	'''send x downstream only if pred(x)'''
+	try:
+		while True:
+			try:
+				item = (yield)
+			except GeneratorExit:
+				raise
+			except Exception as e:
+				target.throw( e )
+				continue
+			if batched:
+				item = list( filter(pred, item) )
+				if item:
+					target.send( item )
+			elif pred( item ):
+				target.send( item )
+	finally:
+		target.close()
+
+@coroutine
+def broadcast( *targets ):
+	'''send every value to all of the targets'''
+	try:
+		while True:
+			try:
+				item = (yield)
+			except GeneratorExit:
+				raise
+			except Exception as e:
+				for target in targets:
+					target.throw( e )
+				continue
+			for target in targets:
+				target.send( item )
+	finally:
+		for target in targets:
+			target.close()
+
+# batcher() and unbatcher() move between the two modes
+@coroutine
+def batcher( size, target ):
+	'''collect single values into lists of up to size'''
+	# (the partial batch is flushed when we're closed, but not when an
+	#   error on its way downstream has ended the pipeline: the target is
+	#   gone by then, and sending to it would hide the error)
+	batch = []
+	try:
+		while True:
+			try:
+				batch.append( (yield) )
+			except GeneratorExit:
+				if batch:
+					target.send( batch )
+				raise
+			except Exception as e:
+				target.throw( e )
+				continue
+			if len(batch) == size:
+				target.send( batch )
+				batch = []
+	finally:
+		target.close()
+
+@coroutine
+def unbatcher( target ):
+	'''send the values of each list downstream one at a time'''
+	try:
+		while True:
+			try:
+				item = (yield)
+			except GeneratorExit:
+				raise
+			except Exception as e:
+				target.throw( e )
+				continue
+			for x in item:
+				target.send( x )
+	finally:
+		target.close()
+
+# the end of the pipeline
+# on_error(e) handles exceptions that reach the sink; without it they
+#   are raised back out to whoever sent or threw
+@coroutine
+def sink( func, batched=False, on_error=None ):
+	'''call func(x) for every x'''
+	while True:
+		try:
+			item = (yield)
+		except GeneratorExit:
+			return
+		except Exception as e:
+			if on_error is None:
+				raise
+			on_error( e )
+			continue
+		if batched:
+			for _ in map( func, item ):
+				pass
+		else:
+			func( item )
+
+def collect( batched=False, on_error=None ):
+	'''a sink that appends to a list: returns (sink, list)'''
+	results = []
+	return sink( results.append, batched, on_error ), results
+
+# drive a pipeline from an iterable, closing it at the end
+def feed( iterable, target, batch=None ):
+	'''send the values of iterable into target (in lists of batch, if given)'''
+	try:
+		if batch is None:
+			send = target.send
+			for x in iterable:
+				send( x )
+		else:
+			it = iter( iterable )
+			for chunk in iter( lambda: list(islice(it, batch)), [] ):
+				target.send( chunk )
+	finally:
+		target.close()
+
+if __name__ == '__main__':
+	from timeit import timeit
+
+	evens, evens_out = collect()
+	odds,  odds_out  = collect()
+	feed( range(10), broadcast(select(lambda x: x % 2 == 0, evens),
+	                           transform(lambda x: x * 10,
+	                                     select(lambda x: x % 20, odds))) )
+	assert evens_out == [0, 2, 4, 6, 8]
+	assert odds_out  == [10, 30, 50, 70, 90]
+
+	# batched mode gives the same answers
+	squares, out = collect( batched=True )
+	feed( range(10), select(lambda x: x % 2, transform(lambda x: x*x, squares,
+	                        batched=True), batched=True), batch=3 )
+	assert out == [1, 9, 25, 49, 81]
+
+	# closing flushes partial batches
+	target, out = collect( batched=True )
+	pipeline = batcher( 4, target )
+	for x in range(6):
+		pipeline.send( x )
+	pipeline.close()
+	assert out == [0, 1, 2, 3, 4, 5]
+
+	# errors travel downstream to a sink that can handle them...
+	errors = []
+	target, out = collect( on_error=errors.append )
+	pipeline = transform( lambda x: x + 1, target )
+	pipeline.send( 1 )
+	pipeline.throw( ValueError('bad record') )
+	pipeline.send( 2 )
+	assert out == [2, 3] and isinstance( errors[0], ValueError )
+
+	# ...or come back out to the sender if nothing handles them
+	target, out = collect()
+	pipeline = transform( lambda x: x + 1, target )
+	try:
+		pipeline.throw( KeyError('unhandled') )
+	except KeyError:
+		pass
+	else:
+		assert False
+	target, out = collect()
+	pipeline = batcher( 3, target )
+	pipeline.send( 1 )
+	try:
+		pipeline.throw( ValueError('unhandled') )
+	except ValueError:
+		pass
+	else:
+		assert False
+
+	# BENCHMARK
+	data = range(1000000)
+	def pull():
+		return sum( x*x for x in (x for x in data if x % 3) )
+	def pull_calls():
+		# the same three calls per value as the push pipelines
+		total = [0]
+		def add( x ):
+			total[0] += x
+		for _ in map( add, map(lambda x: x*x, filter(lambda x: x % 3, data)) ):
+			pass
+		return total[0]
+	def push( batch ):
+		total = [0]
+		def add( x ):
+			total[0] += x
+		feed( data, select(lambda x: x % 3, transform(lambda x: x*x,
+		      sink(add, batched=batch is not None), batched=batch is not None),
+		      batched=batch is not None), batch=batch )
+		return total[0]
+	assert pull() == pull_calls() == push( None ) == push( 1024 )
+	print( 'pull (generators): %.3fs' % timeit(pull, number=1) )
+	print( 'pull (calls):      %.3fs' % timeit(pull_calls, number=1) )
+	print( 'push:              %.3fs' % timeit(lambda: push(None), number=1) )
+	print( 'push (batched):    %.3fs' % timeit(lambda: push(1024), number=1) )
@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# this handout collects the SQLite context managers from the end of
+#   motivation.py into something we can import, and then looks at
+#   what they cost when they're used over and over
+
+from contextlib import contextmanager
+from sqlite3 import connect, OperationalError, DatabaseError
+from threading import Condition, Lock, get_ident
+from time import monotonic
+
+# these are the context managers from motivation.py
+
+@contextmanager
+def connectioncontext( *args, **kwargs ):
+	conn = connect( *args, **kwargs )
+	try:
+		with conn:
+			yield conn
+	finally:
+		conn.close()
+
+@contextmanager
+def cursorcontext( conn ):
+	cursor = conn.cursor()
+	try:
+		yield cursor
+	finally:
+		cursor.close()
+
+# tablecontext() creates a regular table in the main database, so every
+#   scratch computation goes through the journal and fsync()
+# for scratch work, we can instead create the table as:
+#   storage='temp'   : a TEMP table, only visible to this connection
+#                      (kept in RAM only if the connection was set up with
+#                      `PRAGMA temp_store = MEMORY'; that's a setting for
+#                      the whole connection, and changing it drops every
+#                      TEMP table already there, so choose it right after
+#                      connect() rather than here)
+#   storage='memory' : a table in a :memory: database attached as `scratch'
+#                      (it stays attached, since DETACH isn't allowed
+#                      inside the transaction we may be in)
+# either way, the name we yield is qualified (e.g., `temp.employees')
+#   so it can't be confused with a table of the same name in main
+# rows are bulk loaded with executemany() before any indexes are built,
+#   which is much cheaper than maintaining the indexes row by row
+@contextmanager
+def tablecontext( cursor, table, *fields, storage=None, indexes=(), rows=None ):
+	if storage not in (None, 'temp', 'memory'):
+		raise ValueError( "storage must be None, 'temp' or 'memory'" )
+	if storage == 'temp':
+		schema = 'temp'
+	elif storage == 'memory':
+		databases = {r[1] for r in cursor.execute( 'PRAGMA database_list' )}
+		if 'scratch' not in databases:
+			cursor.execute( "ATTACH DATABASE ':memory:' AS scratch" )
+		schema = 'scratch'
+	name = table if storage is None else '%s.%s' % (schema, table)
+	try:
+		# using string interpolation like this is probably
+		#   a bit hacky
+		cursor.execute( 'DROP TABLE %s' % name )
+	except OperationalError:
+		pass
+	cursor.execute( 'CREATE TABLE %s (%s)' % (name, ', '.join(fields)) )
+	try:
+		if rows is not None:
+			cursor.executemany( 'INSERT INTO %s VALUES (%s)' % (
+			                      name, ', '.join('?' * len(fields))), rows )
+		for columns in indexes:
+			if isinstance( columns, str ):
+				columns = columns,
+			index = '%s_%s' % (table, '_'.join(columns))
+			if storage is not None:
+				index = '%s.%s' % (schema, index)
+			cursor.execute( 'CREATE INDEX %s ON %s (%s)' % (
+			                  index, table, ', '.join(columns)) )
+		yield name
+	finally:
+		cursor.execute( 'DROP TABLE %s' % name )
+
+# CONNECTION POOLING
+
+# connectioncontext() opens a brand new connection for every `with`
+#   block: SQLite has to open the file, read and parse the schema,
+#   and start with a cold statement and page cache every time
+# for lots of short operations, this set up can cost more than the
+#   work itself
+
+# a pool keeps a bounded number of connections open and hands them
+#   out for the duration of a `with` block
+# a connection is only ever used by one thread at a time, but we try
+#   to give each thread back the connection it used last, so that
+#   its statement cache stays warm for the queries that thread runs
+# connections that have been idle for a while are checked with a
+#   cheap query before they are handed out again
+
+class ConnectionPool( object ):
+	'''ConnectionPool(*args, maxsize=...) hands out reusable sqlite3 connections'''
+	def __init__( self, *args, maxsize=4, timeout=None, cached_statements=128,
+	              check_after=30.0, **kwargs ):
+		if maxsize < 1:
+			raise ValueError( 'maxsize must be at least 1' )
+		kwargs.setdefault( 'check_same_thread', False )
+		kwargs['cached_statements'] = cached_statements
+		self.args, self.kwargs = args, kwargs
+		self.maxsize, self.timeout, self.check_after = maxsize, timeout, check_after
+		self._cond = Condition( Lock() )
+		self._idle = {}     # thread ident -> [(conn, last used), ...]
+		self._size = 0      # connections open, idle or checked out
+		self._closed = False
+		self._stats = dict.fromkeys( ('created', 'reused', 'stolen', 'waits',
+		                              'timeouts', 'failed_checks', 'closed'), 0 )
+
+	def __repr__( self ):
+		return 'ConnectionPool(%s, maxsize=%d)' % (
+		         ', '.join(map(repr, self.args)), self.maxsize )
+
+	@property
+	def stats( self ):
+		'''a snapshot of the pool counters'''
+		with self._cond:
+			stats = dict( self._stats )
+			stats['idle'] = sum( len(x) for x in self._idle.values() )
+			stats['in_use'] = self._size - stats['idle']
+			stats['size'] = self._size
+		return stats
+
+	# take an idle connection, preferring the one this thread used last
+	# must be called with the lock held
+	def _take_idle( self ):
+		mine = self._idle.get( get_ident() )
+		if mine:
+			self._stats['reused'] += 1
+			return mine.pop()
+		for ident, idle in self._idle.items():
+			if idle:
+				self._stats['stolen'] += 1
+				return idle.pop()
+		return None
+
+	def _healthy( self, conn ):
+		try:
+			conn.execute( 'SELECT 1' ).fetchone()
+			return True
+		except DatabaseError:
+			return False
+
+	def _discard( self, conn ):
+		try:
+			conn.close()
+		except DatabaseError:
+			pass
+		with self._cond:
+			self._size -= 1
+			self._stats['closed'] += 1
+			self._cond.notify()
+
+	def acquire( self ):
+		'''check a connection out of the pool, opening one if there is room'''
+		deadline = None if self.timeout is None else monotonic() + self.timeout
+		while True:
+			with self._cond:
+				while True:
+					if self._closed:
+						raise OperationalError( 'connection pool is closed' )
+					idle = self._take_idle()
+					if idle is not None or self._size < self.maxsize:
+						break
+					self._stats['waits'] += 1
+					remaining = None if deadline is None else deadline - monotonic()
+					if remaining is not None and remaining <= 0 or \
+					   not self._cond.wait( remaining ):
+						self._stats['timeouts'] += 1
+						raise OperationalError( 'connection pool exhausted' )
+				if idle is None:
+					self._size += 1
+					self._stats['created'] += 1
+			if idle is None:
+				try:
+					return connect( *self.args, **self.kwargs )
+				except:
+					with self._cond:
+						self._size -= 1
+						self._cond.notify()
+					raise
+			conn, last_used = idle
+			if monotonic() - last_used < self.check_after or self._healthy( conn ):
+				return conn
+			self._stats['failed_checks'] += 1
+			self._discard( conn )
+
+	def release( self, conn, discard=False ):
+		'''return a connection to the pool'''
+		if not discard and conn.in_transaction:
+			try:
+				conn.rollback()
+			except DatabaseError:
+				discard = True
+		if discard or self._closed:
+			self._discard( conn )
+			return
+		with self._cond:
+			self._idle.setdefault( get_ident(), [] ).append( (conn, monotonic()) )
+			self._cond.notify()
+
+	# the same interface as connectioncontext(): commit on success,
+	#   rollback on error
+	# a connection that raised something other than an ordinary
+	#   SQL error is thrown away rather than reused
+	@contextmanager
+	def connection( self ):
+		conn = self.acquire()
+		try:
+			with conn:
+				yield conn
+		except DatabaseError:
+			self.release( conn )
+			raise
+		except:
+			self.release( conn, discard=True )
+			raise
+		else:
+			self.release( conn )
+
+	def close( self ):
+		'''close all idle connections; checked out ones close on release'''
+		with self._cond:
+			self._closed = True
+			idle = [conn for x in self._idle.values() for conn, _ in x]
+			self._idle.clear()
+			self._cond.notify_all()
+		for conn in idle:
+			self._discard( conn )
+
+	def __enter__( self ):
+		return self
+	def __exit__( self, type, value, traceback ):
+		self.close()
+
+# a drop-in replacement for connectioncontext() that shares one pool
+#   per set of connection arguments
+_pools, _pools_lock = {}, Lock()
+@contextmanager
+def pooledconnectioncontext( *args, **kwargs ):
+	key = args, tuple(sorted(kwargs.items()))
+	with _pools_lock:
+		pool = _pools.get( key )
+		if pool is None:
+			pool = _pools[ key ] = ConnectionPool( *args, **kwargs )
+	with pool.connection() as conn:
+		yield conn
+
+# STREAMING CURSORS
+
+# cursorcontext() yields a raw cursor, and the examples in motivation.py
+#   consume results with `for r in cur.execute(...)`
+# that's fine for two rows, but `list(cur.execute(...))` or
+#   `cur.fetchall()` on millions of rows materialises all of them
+
+# sqlite3 doesn't expose prepare() directly: every execute() looks
+#   its SQL text up in the connection's statement cache
+# we keep one cursor per SQL text in a small LRU, so that the same
+#   query run over and over reuses both the cursor and its compiled
+#   statement, and we consume results in fetchmany() batches, so
+#   memory is bounded by arraysize rather than by the result set
+
+from array import array
+from collections import OrderedDict
+
+class StreamingCursor( object ):
+	'''StreamingCursor(conn, arraysize, cache_size) wraps a connection with cached, streaming cursors'''
+	def __init__( self, conn, arraysize=1024, cache_size=64 ):
+		self.conn, self.arraysize, self.cache_size = conn, arraysize, cache_size
+		self._cursors = OrderedDict()  # sql -> cursor, least recently used first
+		self.hits = self.misses = 0
+
+	# check a cursor for this SQL out of the cache
+	# a cursor being streamed from is not in the cache, so running the
+	#   same query again meanwhile gets a cursor of its own
+	def _checkout( self, sql ):
+		cursor = self._cursors.pop( sql, None )
+		if cursor is None:
+			self.misses += 1
+			cursor = self.conn.cursor()
+		else:
+			self.hits += 1
+		return cursor
+
+	def _checkin( self, sql, cursor ):
+		old = self._cursors.pop( sql, None )
+		if old is not None:
+			old.close()
+		self._cursors[ sql ] = cursor
+		while len(self._cursors) > self.cache_size:
+			self._cursors.popitem( last=False )[1].close()
+
+	# execute() and friends are done with the cursor by the time they
+	#   return, so they hand back results, never the cursor itself: the
+	#   next execute() of the same SQL reuses it, and would clobber the
+	#   results of the last one
+	def execute( self, sql, params=() ):
+		'''execute a statement, returning all its rows as a list
+		   (for big results, use stream() or batches() instead)'''
+		cursor = self._checkout( sql )
+		try:
+			return cursor.execute( sql, params ).fetchall()
+		finally:
+			self._checkin( sql, cursor )
+
+	def executemany( self, sql, seq_of_params ):
+		'''execute a statement for every set of parameters, returning the rowcount'''
+		cursor = self._checkout( sql )
+		try:
+			return cursor.executemany( sql, seq_of_params ).rowcount
+		finally:
+			self._checkin( sql, cursor )
+
+	def scalar( self, sql, params=() ):
+		'''the first column of the first row, or None'''
+		cursor = self._checkout( sql )
+		try:
+			row = cursor.execute( sql, params ).fetchone()
+		finally:
+			self._checkin( sql, cursor )
+		return None if row is None else row[0]
+
+	def batches( self, sql, params=(), arraysize=None ):
+		'''yield lists of row tuples, at most arraysize rows at a time'''
+		cursor = self._checkout( sql )
+		cursor.arraysize = arraysize or self.arraysize
+		try:
+			cursor.execute( sql, params )
+			fetchmany = cursor.fetchmany
+			rows = fetchmany()
+			while rows:
+				yield rows
+				rows = fetchmany()
+		finally:
+			self._checkin( sql, cursor )
+
+	def stream( self, sql, params=(), arraysize=None ):
+		'''yield row tuples one at a time, fetching arraysize rows at a time'''
+		for rows in self.batches( sql, params, arraysize ):
+			for row in rows:
+				yield row
+
+	# column-oriented batches: instead of a list of row tuples, one
+	#   sequence per column
+	# passing typecodes (e.g., 'qd' for an integer and a float column)
+	#   packs each column into an array, which is much more compact than
+	#   a tuple of Python objects and is what you want to feed to
+	#   sum(), statistics, or numpy.frombuffer()
+	def columns( self, sql, params=(), arraysize=None, typecodes=None ):
+		'''yield a tuple of columns (tuples or arrays) per batch'''
+		for rows in self.batches( sql, params, arraysize ):
+			cols = tuple( zip(*rows) )
+			if typecodes is not None:
+				cols = tuple( array(t, c) for t, c in zip(typecodes, cols) )
+			yield cols
+
+	def close( self ):
+		while self._cursors:
+			self._cursors.popitem()[1].close()
+
+# the same shape as cursorcontext()
+@contextmanager
+def streamingcursorcontext( conn, arraysize=1024, cache_size=64 ):
+	cursor = StreamingCursor( conn, arraysize, cache_size )
+	try:
+		yield cursor
+	finally:
+		cursor.close()
+
+if __name__ == '__main__':
+	from os import remove
+	from tempfile import mkstemp
+	from threading import Thread
+	from timeit import default_timer as timer
+
+	_, filename = mkstemp( suffix='.db' )
+	with connectioncontext( filename ) as conn, \
+	       cursorcontext( conn ) as cur:
+		cur.execute( 'CREATE TABLE employees (name text, salary real)' )
+		cur.executemany( 'INSERT INTO employees VALUES (?, ?)',
+		                 (('janet', 200000), ('john', 400000)) )
+
+	select = 'SELECT sum(salary) FROM employees'
+	with ConnectionPool( filename, maxsize=2 ) as pool:
+		for _ in range(10):
+			with pool.connection() as conn:
+				assert 600000 == conn.execute( select ).fetchone()[0]
+		assert pool.stats['created'] == 1 and pool.stats['reused'] == 9
+
+		# errors roll back, and the connection goes back to the pool
+		try:
+			with pool.connection() as conn:
+				conn.execute( 'INSERT INTO employees VALUES ("jim", 65000)' )
+				conn.execute( 'INSERT INTO nonesuch VALUES (1)' )
+		except OperationalError:
+			pass
+		with pool.connection() as conn:
+			assert 600000 == conn.execute( select ).fetchone()[0]
+
+		# threads share the bounded pool
+		def work():
+			for _ in range(50):
+				with pool.connection() as conn:
+					assert 600000 == conn.execute( select ).fetchone()[0]
+		threads = [Thread(target=work) for _ in range(8)]
+		for t in threads: t.start()
+		for t in threads: t.join()
+		assert pool.stats['size'] <= 2
+		print( pool.stats )
+
+	# BENCHMARK
+	N = 2000
+	start = timer()
+	for _ in range(N):
+		with connectioncontext( filename ) as conn:
+			conn.execute( select ).fetchone()
+	fresh = timer() - start
+	start = timer()
+	for _ in range(N):
+		with pooledconnectioncontext( filename ) as conn:
+			conn.execute( select ).fetchone()
+	pooled = timer() - start
+	print( 'connectioncontext:       %.3fs' % fresh )
+	print( 'pooledconnectioncontext: %.3fs' % pooled )
+
+	# stream a larger result set in bounded batches
+	with connectioncontext( filename ) as conn, \
+	       streamingcursorcontext( conn, arraysize=500 ) as cur:
+		cur.execute( 'CREATE TABLE holdings (id integer, value real)' )
+		cur.executemany( 'INSERT INTO holdings VALUES (?, ?)',
+		                 ((i, i * .5) for i in range(100000)) )
+		select = 'SELECT id, value FROM holdings'
+		assert sum( r[1] for r in cur.stream(select) ) == \
+		       cur.scalar( 'SELECT sum(value) FROM holdings' )
+		assert max( len(rows) for rows in cur.batches(select) ) == 500
+		ids, values = 0, 0.0
+		for id_col, value_col in cur.columns( select, typecodes='qd' ):
+			ids, values = ids + sum(id_col), values + sum(value_col)
+		assert ids == sum( range(100000) )
+		for _ in range(10):
+			cur.scalar( 'SELECT count(*) FROM holdings' )
+		assert cur.hits >= 9
+		# results don't share the cached cursor
+		select = 'SELECT id FROM holdings WHERE id >= ? AND id < 5 ORDER BY id'
+		a = cur.execute( select, (0,) )
+		b = cur.execute( select, (3,) )
+		assert a == [(0,), (1,), (2,), (3,), (4,)] and b == [(3,), (4,)]
+		assert cur.executemany( 'UPDATE holdings SET value = value WHERE id = ?',
+		                        [(0,), (1,)] ) == 2
+		cur.execute( 'DROP TABLE holdings' )
+
+	# scratch tables that never touch the disk
+	employees = [('janet', 200000), ('john', 400000)]
+	with connectioncontext( filename ) as conn, \
+	       cursorcontext( conn ) as cur:
+		cur.execute( 'PRAGMA temp_store = MEMORY' )
+		# TEMP tables the connection already had are left alone
+		cur.execute( 'CREATE TEMP TABLE mine (x integer)' )
+		cur.execute( 'INSERT INTO temp.mine VALUES (1)' )
+		conn.commit()
+		for storage in ('temp', 'memory'):
+			with tablecontext( cur, 'employees', 'name text', 'salary real',
+			                   storage=storage, indexes=['name'],
+			                   rows=employees ) as table:
+				assert table == '%s.employees' % ('temp' if storage == 'temp'
+				                                  else 'scratch')
+				select = 'SELECT sum(salary) FROM %s' % table
+				assert 600000 == sum( r[0] for r in cur.execute(select) )
+		assert not cur.execute( 'SELECT * FROM scratch.sqlite_master' ).fetchall()
+		assert cur.execute( 'SELECT x FROM temp.mine' ).fetchall() == [(1,)]
+		assert cur.execute( 'PRAGMA temp_store' ).fetchone()[0] == 2
+
+	# committing many small scratch computations
+	rows = [(i, i * .5) for i in range(1000)]
+	for storage in (None, 'temp', 'memory'):
+		start = timer()
+		with connectioncontext( filename ) as conn, \
+		       cursorcontext( conn ) as cur:
+			cur.execute( 'PRAGMA temp_store = MEMORY' )
+			for _ in range(20):
+				with tablecontext( cur, 'scratch_values', 'id integer',
+				                   'value real', storage=storage,
+				                   indexes=['id'], rows=rows ) as table:
+					cur.execute( 'SELECT sum(value) FROM %s' % table ).fetchone()
+				conn.commit()
+		print( 'tablecontext(storage=%r): %.3fs' % (storage, timer() - start) )
+
+	remove( filename )
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# debugging.md has an idea: replace os.environ with a dict that notes
+#   every key that is accessed, to see which environment variables an
+#   application actually uses and which are old and removable, and do it
+#   in a context manager, so os.environ is always put back the way it was
+
+# here, os.environ is replaced by a proxy that counts the reads and
+#   writes of each key, and passes them on to the real os.environ (so
+#   putenv() still happens, and child processes still see the changes)
+# counting is the only extra work per access: each thread counts into
+#   its own Counters, so the hot path takes no lock, and the counts are
+#   only merged when a report is asked for
+# on exit, os.environ is the original object again, with exactly the
+#   keys and values it had on entry
+
+# (code that did `from os import environ' before tracking started holds
+#   the original mapping, and isn't seen; os.getenv() looks up
+#   os.environ each time, so it is)
+
+import os
+from collections import Counter
+from collections.abc import MutableMapping
+from threading import local
+
+class TrackedEnviron( MutableMapping ):
+	'''a mapping over os.environ that counts reads and writes per key'''
+	def __init__( self, environ ):
+		self._environ = environ
+		self._local = local()
+		self._counters = []         # (reads, writes) of every thread
+		self.enumerations = 0       # iterations over the whole mapping
+
+	def _counts( self ):
+		try:
+			return self._local.counts
+		except AttributeError:
+			counts = self._local.counts = ( Counter(), Counter() )
+			self._counters.append( counts )  # list.append is atomic
+			return counts
+
+	# reads
+	def __getitem__( self, key ):
+		try:
+			reads = self._local.counts[0]
+		except AttributeError:
+			reads = self._counts()[0]
+		reads[ key ] += 1
+		return self._environ[ key ]
+	def __contains__( self, key ):
+		try:
+			reads = self._local.counts[0]
+		except AttributeError:
+			reads = self._counts()[0]
+		reads[ key ] += 1
+		return key in self._environ
+	def get( self, key, default=None ):
+		# Mapping.get would go through __getitem__ and KeyError
+		try:
+			reads = self._local.counts[0]
+		except AttributeError:
+			reads = self._counts()[0]
+		reads[ key ] += 1
+		return self._environ.get( key, default )
+
+	# writes
+	def __setitem__( self, key, value ):
+		self._counts()[1][ key ] += 1
+		self._environ[ key ] = value
+	def __delitem__( self, key ):
+		self._counts()[1][ key ] += 1
+		del self._environ[ key ]
+
+	# iterating over everything (e.g., to copy it for a subprocess) says
+	#   nothing about which variables are used, so it's counted apart
+	def __iter__( self ):
+		self.enumerations += 1
+		return iter( self._environ )
+	def __len__( self ):
+		return len( self._environ )
+	def copy( self ):
+		self.enumerations += 1
+		return self._environ.copy()
+	def __repr__( self ):
+		return 'TrackedEnviron(%r)' % (self._environ,)
+
+	# reports
+	def reads( self ):
+		total = Counter()
+		for reads, _ in list( self._counters ):
+			total.update( reads )
+		return total
+	def writes( self ):
+		total = Counter()
+		for _, writes in list( self._counters ):
+			total.update( writes )
+		return total
+
+class tracking( object ):
+	'''with tracking() as env: ... -- count environment variable accesses'''
+	def __init__( self ):
+		self.env = None
+
+	def __enter__( self ):
+		self.original = os.environ
+		self.snapshot = dict( self.original )
+		self.env = os.environ = TrackedEnviron( self.original )
+		return self
+
+	def __exit__( self, *exc ):
+		os.environ = original = self.original
+		snapshot = self.snapshot
+		for key in [k for k in original if k not in snapshot]:
+			del original[ key ]
+		for key, value in snapshot.items():
+			if original.get( key ) != value:
+				original[ key ] = value
+
+	# reads() and writes() keep working after the block has exited
+	def reads( self ):
+		return self.env.reads()
+	def writes( self ):
+		return self.env.writes()
+
+	def used( self ):
+		'''variables that were set on entry and read'''
+		reads = self.reads()
+		return sorted( k for k in self.snapshot if reads[k] )
+	def unused( self ):
+		'''variables that were set on entry and never read'''
+		reads = self.reads()
+		return sorted( k for k in self.snapshot if not reads[k] )
+	def missing( self ):
+		'''variables that were read but weren't set on entry'''
+		return sorted( k for k in self.reads() if k not in self.snapshot )
+
+	def report( self ):
+		reads, writes = self.reads(), self.writes()
+		lines = [ '%-30s %6s %6s' % ('variable', 'reads', 'writes') ]
+		for key in sorted( set(reads) | set(writes) ):
+			lines.append( '%-30s %6d %6d%s' % (key, reads[key], writes[key],
+			              '' if key in self.snapshot else '  (not set)') )
+		lines.append( 'unused: %s' % ', '.join(self.unused()) )
+		if self.env.enumerations:
+			lines.append( '(the whole environment was iterated over %d times)'
+			              % self.env.enumerations )
+		return '\n'.join( lines )
+
+if __name__ == '__main__':
+	from threading import Thread
+	from timeit import timeit
+
+	os.environ[ 'ENVIRON_DEMO_KEEP' ] = 'original'
+	before = dict( os.environ )
+	real = os.environ
+
+	with tracking() as env:
+		assert os.environ is not real
+		assert os.getenv( 'ENVIRON_DEMO_KEEP' ) == 'original'
+		assert os.environ.get( 'ENVIRON_DEMO_MISSING' ) is None
+		assert 'ENVIRON_DEMO_KEEP' in os.environ
+		os.environ[ 'ENVIRON_DEMO_KEEP' ] = 'changed'
+		os.environ[ 'ENVIRON_DEMO_NEW' ] = 'new'
+		assert real[ 'ENVIRON_DEMO_NEW' ] == 'new'  # writes go through
+
+		def reader():
+			for _ in range( 1000 ):
+				os.environ.get( 'ENVIRON_DEMO_KEEP' )
+		threads = [Thread(target=reader) for _ in range(4)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+
+	# restored: the same object, with the same contents
+	assert os.environ is real and dict( os.environ ) == before
+	assert env.reads()[ 'ENVIRON_DEMO_KEEP' ] == 2 + 4000
+	assert env.writes() == { 'ENVIRON_DEMO_KEEP': 1, 'ENVIRON_DEMO_NEW': 1 }
+	assert 'ENVIRON_DEMO_KEEP' in env.used()
+	assert env.missing() == [ 'ENVIRON_DEMO_MISSING' ]
+	assert 'ENVIRON_DEMO_KEEP' not in env.unused()
+	del os.environ[ 'ENVIRON_DEMO_KEEP' ]
+
+	# BENCHMARK
+	# a configuration lookup, the way environment-heavy code does it
+	keys = ['HOME', 'PATH', 'LANG', 'NO_SUCH_VARIABLE'] * 25
+	def lookups():
+		getenv = os.getenv
+		for key in keys:
+			getenv( key, '' )
+	plain = timeit( lookups, number=2000 )
+	with tracking() as env:
+		tracked = timeit( lookups, number=2000 )
+	print( 'os.getenv, plain:   %.1fns per call' % (plain / len(keys) / 2000 * 1e9) )
+	print( 'os.getenv, tracked: %.1fns per call' % (tracked / len(keys) / 2000 * 1e9) )
+	print( '\n'.join(env.report().splitlines()[:5]) )
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# motivation.py ends its look at contextlib.closing() with
+#   with closing(urlopen('http://www.python.org', timeout=1)) as page:
+#       ...
+# which is fine for one page, but every urlopen() opens a new TCP
+#   connection, and the pages are fetched one after another
+# for tens of thousands of URLs, connection set up and waiting on the
+#   network dominate everything else
+
+# this handout keeps the closing() pattern but:
+#   1. keeps one HTTP/1.1 connection open per host per worker thread
+#      and reuses it for the next URL on that host (keep-alive); each
+#      thread keeps at most max_idle of them, closing the one it used
+#      least recently, so URLs spread over many hosts don't use up
+#      the process's file descriptors
+#   2. fetches with a bounded pool of worker threads
+#   3. paces requests to each host, so we don't hammer any one server
+#   4. streams bodies to disk in chunks instead of holding them in memory
+
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from threading import Lock, local
+from time import monotonic, sleep
+from urllib.parse import urlsplit
+
+Result = namedtuple( 'Result', 'url status size path body error' )
+
+# a simple pacing limiter: requests to a host are spaced at least
+#   1/rate seconds apart, no matter which thread makes them
+class RateLimiter( object ):
+	'''RateLimiter(rate) spaces calls to wait() at least 1/rate seconds apart'''
+	def __init__( self, rate ):
+		self.interval = 1. / rate
+		self._next = monotonic()
+		self._lock = Lock()
+	def wait( self ):
+		with self._lock:
+			now = monotonic()
+			at = max( now, self._next )
+			self._next = at + self.interval
+		if at > now:
+			sleep( at - now )
+
+class Fetcher( object ):
+	'''Fetcher(max_workers, rate, timeout, max_idle) fetches many URLs over reused connections'''
+	def __init__( self, max_workers=8, rate=None, timeout=10, chunk_size=64*1024,
+	              max_idle=8 ):
+		self.max_workers, self.rate = max_workers, rate
+		self.timeout, self.chunk_size = timeout, chunk_size
+		self.max_idle = max( 1, max_idle )
+		self._local = local()          # per thread: (scheme, netloc) -> connection
+		self._limiters, self._limiters_lock = {}, Lock()
+		self._all, self._all_lock = set(), Lock()   # every open connection
+		self._executor = None
+
+	def _drop( self, conn ):
+		conn.close()
+		with self._all_lock:
+			self._all.discard( conn )
+
+	def _connection( self, scheme, netloc, fresh=False ):
+		conns = getattr( self._local, 'conns', None )
+		if conns is None:
+			conns = self._local.conns = OrderedDict()  # least recently used first
+		key = scheme, netloc
+		conn = conns.pop( key, None )
+		if conn is not None and fresh:
+			self._drop( conn )
+			conn = None
+		if conn is None:
+			while len( conns ) >= self.max_idle:
+				self._drop( conns.popitem(last=False)[1] )
+			factory = HTTPSConnection if scheme == 'https' else HTTPConnection
+			conn = factory( netloc, timeout=self.timeout )
+			with self._all_lock:
+				self._all.add( conn )
+		conns[ key ] = conn
+		return conn
+
+	def _limit( self, netloc ):
+		if self.rate is None:
+			return
+		with self._limiters_lock:
+			limiter = self._limiters.get( netloc )
+			if limiter is None:
+				limiter = self._limiters[ netloc ] = RateLimiter( self.rate )
+		limiter.wait()
+
+	# send the request, retrying once on a fresh connection if a kept-alive
+	#   one turns out to have been closed by the server in the meantime
+	def _request( self, url ):
+		parts = urlsplit( url )
+		path = parts.path or '/'
+		if parts.query:
+			path += '?' + parts.query
+		self._limit( parts.netloc )
+		for fresh in (False, True):
+			conn = self._connection( parts.scheme, parts.netloc, fresh )
+			try:
+				conn.request( 'GET', path )
+				return conn.getresponse()
+			except (HTTPException, ConnectionError):
+				conn.close()
+				if fresh:
+					raise
+
+	# the response must be read to the end before the connection can
+	#   be reused, so we always drain it, even if we only write it out
+	def fetch( self, url, path=None ):
+		'''fetch(url, path=None) -> Result; the body is written to path if given'''
+		try:
+			with closing( self._request(url) ) as response:
+				size = 0
+				if path is None:
+					body = response.read()
+					size = len( body )
+				else:
+					body = None
+					with open( path, 'wb' ) as f:
+						for chunk in iter( lambda: response.read(self.chunk_size), b'' ):
+							f.write( chunk )
+							size += len( chunk )
+				return Result( url, response.status, size, path, body, None )
+		except (OSError, HTTPException) as e:
+			return Result( url, None, 0, path, None, e )
+
+	def map( self, urls, paths=None ):
+		'''fetch urls concurrently, yielding Results as they complete'''
+		if self._executor is None:
+			self._executor = ThreadPoolExecutor( self.max_workers )
+		paths = [None] * len(urls) if paths is None else paths
+		futures = [self._executor.submit( self.fetch, url, path )
+		           for url, path in zip(urls, paths)]
+		for future in as_completed( futures ):
+			yield future.result()
+
+	def close( self ):
+		if self._executor is not None:
+			self._executor.shutdown()
+			self._executor = None
+		with self._all_lock:
+			for conn in self._all:
+				conn.close()
+			self._all.clear()
+
+if __name__ == '__main__':
+	from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+	from functools import partial
+	from os.path import join, getsize
+	from shutil import rmtree
+	from tempfile import mkdtemp
+	from threading import Thread
+	from timeit import default_timer as timer
+
+	# a local stand-in for the web: serve a directory of files over
+	#   HTTP/1.1 and count how many TCP connections get opened
+	root, dest = mkdtemp(), mkdtemp()
+	for i in range(200):
+		with open( join(root, '%d.txt' % i), 'wb' ) as f:
+			f.write( b'x' * (i * 1000) )
+
+	connections = []
+	class Handler( SimpleHTTPRequestHandler ):
+		protocol_version = 'HTTP/1.1'
+		disable_nagle_algorithm = True  # or delayed ACKs stall keep-alive
+		def setup( self ):
+			connections.append( self.client_address )
+			SimpleHTTPRequestHandler.setup( self )
+		def log_message( self, *args ):
+			pass
+
+	server = ThreadingHTTPServer( ('127.0.0.1', 0), partial(Handler, directory=root) )
+	Thread( target=server.serve_forever, daemon=True ).start()
+	base = 'http://127.0.0.1:%d/' % server.server_address[1]
+	urls = [base + '%d.txt' % i for i in range(200)]
+
+	# one at a time, a fresh connection each time
+	from urllib.request import urlopen
+	start = timer()
+	for url in urls:
+		with closing( urlopen(url, timeout=1) ) as page:
+			page.read()
+	print( 'urlopen: %.3fs, %d connections' % (timer() - start, len(connections)) )
+
+	del connections[:]
+	start = timer()
+	with closing( Fetcher(max_workers=4) ) as fetcher:
+		paths = [join(dest, '%d.txt' % i) for i in range(200)]
+		results = list( fetcher.map(urls, paths) )
+	print( 'Fetcher: %.3fs, %d connections' % (timer() - start, len(connections)) )
+	assert all( r.status == 200 and r.error is None for r in results )
+	assert all( r.size == getsize(r.path) for r in results )
+	assert len( connections ) <= 4
+
+	# missing pages and unreachable hosts are reported, not raised
+	with closing( Fetcher(rate=50) ) as fetcher:
+		assert fetcher.fetch( base + 'nonesuch' ).status == 404
+		assert fetcher.fetch( 'http://127.0.0.1:1/' ).error is not None
+		start = timer()
+		for _ in fetcher.map( urls[:10] ):
+			pass
+		assert timer() - start >= 9 / 50.
+
+	# URLs spread over many hosts keep only max_idle connections open
+	servers = [ ThreadingHTTPServer(('127.0.0.1', 0), partial(Handler, directory=root))
+	            for _ in range(6) ]
+	for s in servers:
+		Thread( target=s.serve_forever, daemon=True ).start()
+	with closing( Fetcher(max_workers=1, max_idle=2) ) as fetcher:
+		for _ in range( 3 ):
+			for s in servers:
+				url = 'http://127.0.0.1:%d/1.txt' % s.server_address[1]
+				assert fetcher.fetch( url ).status == 200
+				assert len( fetcher._all ) <= 2
+	for s in servers:
+		s.shutdown()
+
+	server.shutdown()
+	rmtree( root )
+	rmtree( dest )
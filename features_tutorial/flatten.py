@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# notes.md flattens with `yield from`, and syntax.py's chain(xs, ys)
+#   nests one generator inside another
+# the recursive version of flatten looks like this:
+#   def flatten( xs ):
+#       for x in xs:
+#           if isinstance( x, list ):
+#               yield from flatten( x )
+#           else:
+#               yield x
+# every element at depth d passes up through d suspended generators,
+#   so deep nesting costs a frame resume per level per element, and
+#   nesting deeper than the recursion limit raises RecursionError
+
+# instead, we can keep our own stack of iterators: every element is
+#   yielded exactly once, from one frame, and the depth is limited
+#   only by memory
+
+from itertools import islice
+
+# whether a type is a container we should descend into is decided once
+#   per type and then remembered, rather than asking isinstance() or
+#   trying iter() for every element
+# strings are iterable, but flattening 'abc' into 'a', 'b', 'c' (and
+#   then each 'a' into 'a' forever) is never what we want, so they are
+#   leaves by default
+LEAVES = (str, bytes, bytearray, memoryview)
+
+class Flattener( object ):
+	'''Flattener(leaves, containers) flattens arbitrarily nested iterables'''
+	# containers: if given, only these types are descended into
+	# leaves:     types never descended into, even if iterable
+	def __init__( self, leaves=LEAVES, containers=None ):
+		self.leaves, self.containers = tuple(leaves), containers
+		self._is_container = {}
+
+	def is_container( self, tp ):
+		try:
+			return self._is_container[ tp ]
+		except KeyError:
+			if issubclass( tp, self.leaves ):
+				rv = False
+			elif self.containers is not None:
+				rv = issubclass( tp, tuple(self.containers) )
+			else:
+				rv = hasattr( tp, '__iter__' )
+			self._is_container[ tp ] = rv
+			return rv
+
+	def __call__( self, iterable, max_depth=None ):
+		'''yield the leaves of iterable, in order'''
+		is_container, known = self.is_container, self._is_container
+		stack = [iter( iterable )]
+		push, pop = stack.append, stack.pop
+		while stack:
+			for x in stack[-1]:
+				tp = type( x )
+				container = known[ tp ] if tp in known else is_container( tp )
+				if container and (max_depth is None or len(stack) <= max_depth):
+					push( iter(x) )
+					break
+				yield x
+			else:
+				pop()
+
+	def batches( self, iterable, size, max_depth=None ):
+		'''yield the leaves of iterable in lists of up to size'''
+		it = self( iterable, max_depth )
+		while True:
+			batch = list( islice(it, size) )
+			if not batch:
+				return
+			yield batch
+
+flatten = Flattener()
+
+if __name__ == '__main__':
+	from sys import getrecursionlimit
+	from timeit import timeit
+
+	assert list(flatten([1, [2, [3, [4]], 5], (6,), 'seven', []])) == \
+	       [1, 2, 3, 4, 5, 6, 'seven']
+	assert list(flatten([1, [2, [3, [4]]]], max_depth=1)) == [1, 2, [3, [4]]]
+	assert list(Flattener(containers=(list,))([1, (2, 3), [4, {5}]])) == \
+	       [1, (2, 3), 4, {5}]
+	assert list(flatten.batches(range(10), 4)) == [[0,1,2,3],[4,5,6,7],[8,9]]
+
+	# generators nest the same way lists do
+	def chain( xs, ys ):
+		for x in xs:
+			yield x
+		for y in ys:
+			yield y
+	assert list(flatten(chain([1, chain([2], [3])], [[4]]))) == [1, 2, 3, 4]
+
+	# deeper than the recursion limit
+	deep = [0]
+	for _ in range(getrecursionlimit() * 2):
+		deep = [deep]
+	assert list(flatten(deep)) == [0]
+
+	# BENCHMARK
+	def recursive( xs ):
+		for x in xs:
+			if isinstance( x, (list, tuple) ):
+				yield from recursive( x )
+			else:
+				yield x
+
+	def nested( depth, width ):
+		return list(range(width)) if depth == 0 else \
+		       [nested(depth - 1, width) for _ in range(width)]
+	spine = []
+	for _ in range(300):
+		spine = list(range(10)) + [spine]
+	for label, xs in (('wide (depth 1)',   nested(1, 300)),
+	                  ('bushy (depth 10)', nested(10, 3)),
+	                  ('deep (depth 300)', spine)):
+		assert list(recursive(xs)) == list(flatten(xs))
+		print( '%-16s: yield from %.3fs, Flattener %.3fs' % ( label,
+		         timeit(lambda: list(recursive(xs)), number=5),
+		         timeit(lambda: list(flatten(xs)), number=5)) )
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# the reusable helpers from motivation.py, without the examples
+# motivation.py is meant to be read top to bottom, and runs every
+#   example (including a database, a network request and a dictionary
+#   file) as it goes; this module only defines things, so importing it
+#   is cheap
+# anything that needs a heavier module imports it on first use, through
+#   lazy.py: the locale and urllib.request modules are loaded lazily, and
+#   the database and money helpers are only imported from dbcontext.py
+#   and money.py when they're first looked up here
+
+import sys
+from contextlib import contextmanager
+from functools import wraps
+from itertools import combinations, permutations, tee
+
+from lazy import lazy_import, lazy_attributes
+
+locale = lazy_import( 'locale' )
+request = lazy_import( 'urllib.request' )
+
+__getattr__, __dir__ = lazy_attributes( globals(),
+	Decimal           = 'decimal:Decimal',
+	localcontext      = 'decimal:localcontext',
+	connect           = 'sqlite3:connect',
+	connectioncontext = 'dbcontext:connectioncontext',
+	cursorcontext     = 'dbcontext:cursorcontext',
+	tablecontext      = 'dbcontext:tablecontext',
+	FixedContext      = 'money:FixedContext',
+	Money             = 'money:Money',
+)
+
+# GENERATORS
+
+def squares( iterable ):
+	for x in iterable:
+		yield x, x**2
+
+def pairwise( iterable, n ):
+	'''yield each run of n consecutive values as a tuple'''
+	iterables = tee( iterable, n )
+	for i, it in enumerate( iterables ):
+		for _ in range( i ):
+			next( it, None )
+	return zip( *iterables )
+
+def contiguous( iterable ):
+	buffer = []
+	for x in iterable:
+		if buffer and x - buffer[-1] > 1:
+			yield buffer
+			buffer = []
+		buffer.append( x )
+	if buffer:
+		yield buffer
+
+def to_ranges( iterable ):
+	for subset in contiguous( iterable ):
+		yield '%d' % subset[0] \
+		       if len(subset) == 1 else \
+		       '%d-%d' % (subset[0], subset[-1])
+
+def my_zip( *iterables ):
+	iterables = [iter(x) for x in iterables]
+	rv = []
+	while True:
+		try:
+			val = [next(x) for x in iterables]
+			rv.append( tuple(val) )
+		except StopIteration:
+			return rv
+
+def my_map( func, *iterables ):
+	rv = []
+	for elements in zip(*iterables):
+		rv.append( func(*elements) )
+	return rv
+
+def my_filter( pred, iterable ):
+	pred = bool if pred is None else pred
+	rv = []
+	for element in iterable:
+		if pred( element ):
+			rv.append( element )
+	return rv
+
+def powerset( iterable ):
+	iterable = list(iterable)
+	for r in range(1,len(iterable)+1):
+		for x in combinations( iterable, r ):
+			yield x
+
+def all_permutations( iterable ):
+	iterable = list(iterable)
+	for r in range(1,len(iterable)+1):
+		for x in permutations( iterable, r ):
+			yield x
+
+# the word-finder
+def load_dictionary( filename='/usr/share/dict/words' ):
+	try:
+		with open( filename ) as f:
+			return set( x.strip().lower() for x in f )
+	except IOError:
+		return {'a','apple','b','ball','c','cat','d','dog'}
+
+def valid_words( letters, dictionary ):
+	return sorted( {''.join(x) for x in all_permutations(letters)} & dictionary )
+
+# DECORATORS
+
+def logger( func ):
+	'''logger adds logging to a function'''
+	@wraps( func )
+	def wrapper( *args, **kwargs ):
+		print( 'calling %s' % func.__name__, file=sys.stderr )
+		rv = func( *args, **kwargs )
+		print( 'returning %s' % rv, file=sys.stderr )
+		return rv
+	return wrapper
+
+def document( *lines ):
+	def decorator( func ):
+		func.__doc__ = '\n'.join([func.__doc__ or '']+list(lines))
+		return func
+	return decorator
+def precondition( *lines ):
+	return document(*('precondition: ' + x for x in lines))
+def postcondition( *lines ):
+	return document(*('postcondition: ' + x for x in lines))
+
+# CONTEXT MANAGERS
+
+@contextmanager
+def capture_print( stdout, stderr ):
+	sys.stdout, sys.stderr, old = stdout, stderr, (sys.stdout, sys.stderr)
+	try:
+		yield
+	finally:
+		sys.stdout, sys.stderr = old
+
+@contextmanager
+def localecontext( *name ):
+	old = locale.setlocale( locale.LC_ALL )
+	locale.setlocale( locale.LC_ALL, name )
+	try:
+		yield locale.localeconv()
+	finally:
+		locale.setlocale( locale.LC_ALL, old )
+
+def urlopen( url, timeout=1 ):
+	'''urllib.request.urlopen, with a short default timeout'''
+	return request.urlopen( url, timeout=timeout )
+
+if __name__ == '__main__':
+	from io import StringIO
+
+	assert list(squares(range(3))) == [(0,0),(1,1),(2,4)]
+	assert [''.join(x) for x in pairwise('abcd', 3)] == ['abc', 'bcd']
+	assert list(to_ranges([1,2,3,5,10,11,12,17])) == ['1-3','5','10-12','17']
+	assert my_zip(range(5), 'abc') == list(zip(range(5), 'abc'))
+	assert my_map(lambda x,y: x**y, range(4), range(4)) == [1, 1, 4, 27]
+	assert my_filter(None, [False,True,0,1,'','a']) == [True,1,'a']
+	assert [''.join(x) for x in powerset('abc')] == \
+	       ['a','b','c','ab','ac','bc','abc']
+	assert len(list(all_permutations('abc'))) == 15
+	assert valid_words('tac', {'a','cat','act','dog'}) == ['a','act','cat']
+
+	@postcondition( 'retval > 0' )
+	@precondition( 'x >= 0' )
+	def root( x ):
+		return x ** 0.5
+	assert root.__doc__ == '\nprecondition: x >= 0\npostcondition: retval > 0'
+
+	buf = StringIO()
+	with capture_print( buf, buf ):
+		print( 'foo' )
+	assert buf.getvalue() == 'foo\n'
+
+	# none of the heavy modules has been loaded yet
+	# (the lazy names are module attributes: run as a script, this is
+	#   __main__, so we look them up on the imported module)
+	assert 'sqlite3' not in sys.modules and 'decimal' not in sys.modules
+	import helpers
+	from helpers import connectioncontext, cursorcontext, tablecontext
+	with connectioncontext( ':memory:' ) as conn, cursorcontext( conn ) as cur, \
+	     tablecontext( cur, 'employees', 'name text', 'salary real' ) as table:
+		cur.executemany( 'INSERT INTO %s VALUES (?, ?)' % table,
+		                 (('janet', 200000), ('john',  400000)) )
+		assert cur.execute( 'SELECT sum(salary) FROM %s' % table ).fetchone()[0] == 600000
+	assert 'sqlite3' in sys.modules and 'decimal' not in sys.modules
+	with helpers.localcontext() as ctx:
+		ctx.prec = 4
+		assert str( helpers.Decimal(1) / helpers.Decimal(3) ) == '0.3333'
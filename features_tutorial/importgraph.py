@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# debugging.md suggests an import hook to `graph everything that is
+#   imported'; the same hook can also tell us where startup time goes
+# a finder at the front of sys.meta_path sees every module the first
+#   time it is imported: it asks the other finders for the spec, and
+#   wraps the loader so that executing the module is timed too
+# while module A is executing, any module it imports for the first time
+#   is recorded as a child of A, so for each module we get:
+#   cumulative: from the start of its find to the end of its exec
+#   self:       cumulative, less the cumulative time of its children
+# (modules that are already in sys.modules never reach a finder, so an
+#   edge is only recorded for the import that actually loaded a module)
+
+# when no recording is going on, the finder isn't on sys.meta_path at
+#   all, so it costs nothing
+# (python -X importtime prints similar numbers, but only to stderr, and
+#   only for a whole interpreter run)
+
+import json
+import sys
+from threading import local
+from time import perf_counter
+
+class _Module( object ):
+	__slots__ = ( 'name', 'parent', 'children', 'start', 'cumulative', 'self' )
+	def __init__( self, name, parent, start ):
+		self.name, self.parent, self.start = name, parent, start
+		self.children = []
+		self.cumulative = self.self = 0.
+
+class _TimedLoader( object ):
+	'''wraps a loader, timing create_module() and exec_module()'''
+	def __init__( self, loader, recorder, record ):
+		self._loader, self._recorder, self._record = loader, recorder, record
+	def __getattr__( self, name ):
+		# everything else (get_data, is_package, get_resource_reader...)
+		#   goes straight to the real loader
+		return getattr( self._loader, name )
+	def create_module( self, spec ):
+		# extension modules do all their work in here
+		stack = self._recorder._stack()
+		stack.append( self._record )
+		try:
+			return self._loader.create_module( spec )
+		finally:
+			stack.pop()
+	def exec_module( self, module ):
+		stack = self._recorder._stack()
+		stack.append( self._record )
+		try:
+			self._loader.exec_module( module )
+		finally:
+			stack.pop()
+			self._recorder._finish( self._record )
+
+class ImportRecorder( object ):
+	'''a sys.meta_path finder that records the import graph and its timings'''
+	def __init__( self ):
+		self.modules = {}           # name -> _Module, in import order
+		self._local = local()
+
+	def _stack( self ):
+		try:
+			return self._local.stack
+		except AttributeError:
+			self._local.stack = []
+			return self._local.stack
+
+	# installation
+	def install( self ):
+		if self not in sys.meta_path:
+			sys.meta_path.insert( 0, self )
+		return self
+	def uninstall( self ):
+		if self in sys.meta_path:
+			sys.meta_path.remove( self )
+	def __enter__( self ):
+		return self.install()
+	def __exit__( self, *exc ):
+		self.uninstall()
+
+	# the finder protocol
+	def find_spec( self, name, path, target=None ):
+		start = perf_counter()
+		spec = None
+		finders = sys.meta_path
+		for finder in finders[ finders.index(self) + 1: ]:
+			find_spec = getattr( finder, 'find_spec', None )
+			if find_spec is not None:
+				spec = find_spec( name, path, target )
+				if spec is not None:
+					break
+		if spec is None or spec.loader is None:
+			return spec
+		stack = self._stack()
+		parent = stack[-1] if stack else None
+		record = _Module( name, parent and parent.name, start )
+		if parent is not None:
+			parent.children.append( name )
+		self.modules[ name ] = record
+		spec.loader = _TimedLoader( spec.loader, self, record )
+		return spec
+
+	def _finish( self, record ):
+		record.cumulative = perf_counter() - record.start
+		modules = self.modules
+		record.self = record.cumulative - sum( modules[c].cumulative
+		                                       for c in record.children )
+
+	# reports
+	def roots( self ):
+		'''the modules imported directly by the code being recorded'''
+		return [m.name for m in self.modules.values() if m.parent is None]
+
+	def total( self ):
+		return sum( self.modules[name].cumulative for name in self.roots() )
+
+	def dominant( self, fraction=.05 ):
+		'''(name, self, cumulative) for modules whose own time is at least
+		   fraction of the total, slowest first'''
+		total = self.total()
+		slow = [m for m in self.modules.values()
+		        if total and m.self >= fraction * total]
+		slow.sort( key=lambda m: m.self, reverse=True )
+		return [(m.name, m.self, m.cumulative) for m in slow]
+
+	def as_dict( self ):
+		return { m.name: { 'parent':     m.parent,
+		                   'children':   list(m.children),
+		                   'self':       m.self,
+		                   'cumulative': m.cumulative }
+		         for m in self.modules.values() }
+
+	def to_json( self, **kwargs ):
+		return json.dumps( self.as_dict(), **kwargs )
+
+	def to_dot( self, fraction=.05 ):
+		'''a graphviz digraph; the dominant modules are filled in red'''
+		slow = { name for name, _, _ in self.dominant(fraction) }
+		lines = [ 'digraph imports {', '\tnode [shape=box];' ]
+		for m in self.modules.values():
+			style = ', style=filled, fillcolor="#ff9999"' if m.name in slow else ''
+			lines.append( '\t"%s" [label="%s\\n%.1fms / %.1fms"%s];' % (
+			              m.name, m.name, m.self * 1e3, m.cumulative * 1e3, style) )
+		for m in self.modules.values():
+			for child in m.children:
+				lines.append( '\t"%s" -> "%s";' % (m.name, child) )
+		lines.append( '}' )
+		return '\n'.join( lines )
+
+def recording():
+	'''with recording() as graph: import ...'''
+	return ImportRecorder()
+
+if __name__ == '__main__':
+	import os
+	import shutil
+	import tempfile
+	from importlib import invalidate_caches
+
+	# a little package of modules importing each other, one of them slow
+	root = tempfile.mkdtemp()
+	package = os.path.join( root, 'demo_pkg' )
+	os.mkdir( package )
+	sources = {
+		'__init__': 'from . import app\n',
+		'app':      'from . import models, views\n',
+		'models':   'from . import db\n',
+		'views':    'from . import models, templates\n',
+		'db':       'import time\ntime.sleep(.05)\n',
+		'templates': 'x = sum(range(100000))\n',
+	}
+	for name, source in sources.items():
+		with open( os.path.join(package, name + '.py'), 'w' ) as f:
+			f.write( source )
+	sys.path.insert( 0, root )
+	invalidate_caches()
+
+	def forget():
+		for name in list( sys.modules ):
+			if name.startswith( 'demo_pkg' ):
+				del sys.modules[ name ]
+
+	with recording() as graph:
+		import demo_pkg
+	assert graph not in sys.meta_path
+
+	assert graph.roots() == [ 'demo_pkg' ]
+	assert graph.modules[ 'demo_pkg' ].children == [ 'demo_pkg.app' ]
+	assert graph.modules[ 'demo_pkg.app' ].children == \
+	       [ 'demo_pkg.models', 'demo_pkg.views' ]
+	# views imports models too, but models was already loaded by then
+	assert graph.modules[ 'demo_pkg.views' ].children == [ 'demo_pkg.templates' ]
+	assert graph.dominant( .5 )[0][0] == 'demo_pkg.db'
+	db = graph.modules[ 'demo_pkg.db' ]
+	assert db.self >= .05 and graph.modules[ 'demo_pkg' ].cumulative >= db.cumulative
+	# the module's real loader is still reachable through the wrapper
+	assert demo_pkg.__spec__.loader.get_filename( 'demo_pkg' ).endswith( '__init__.py' )
+	assert json.loads( graph.to_json() )[ 'demo_pkg.db' ][ 'parent' ] == 'demo_pkg.models'
+	assert '"demo_pkg.app" -> "demo_pkg.models";' in graph.to_dot()
+
+	for name, own, cumulative in graph.dominant( .01 ):
+		print( '%-20s self %6.1fms  cumulative %6.1fms' % (name, own * 1e3,
+		                                                   cumulative * 1e3) )
+
+	# overhead, on a package without the slow module
+	with open( os.path.join(package, 'db.py'), 'w' ) as f:
+		f.write( '' )
+	invalidate_caches()
+	def cold_import( n=50, recorder=None ):
+		elapsed = 0.
+		for _ in range( n ):
+			forget()
+			start = perf_counter()
+			if recorder is None:
+				import demo_pkg
+			else:
+				with recorder():
+					import demo_pkg
+			elapsed += perf_counter() - start
+		return elapsed / n
+	cold_import()  # warm up the bytecode cache
+	print( 'cold import, not recording: %.3fms' % (cold_import() * 1e3) )
+	print( 'cold import, recording:     %.3fms' % (cold_import(recorder=recording) * 1e3) )
+
+	sys.path.remove( root )
+	shutil.rmtree( root )
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# motivation.py imports sqlite3, decimal, locale, urllib2, random and
+#   more as it goes, and runs every example as it is imported
+# that's the point of a handout, but a tool that only wants to_ranges()
+#   shouldn't pay for an HTTP client and a database driver at startup
+
+# two ways of putting an import off until something is actually used:
+#   1. lazy_import(name) returns a module object straight away, but
+#      only executes the module when one of its attributes is first
+#      looked up (importlib.util.LazyLoader does the deferring)
+#   2. lazy_attributes() builds a module-level __getattr__ (PEP 562),
+#      so `from helpers import Decimal' imports decimal only then;
+#      the value is stored in the module's globals, so later lookups
+#      never reach __getattr__ again
+# helpers.py uses both, for the reusable parts of motivation.py
+
+import sys
+from importlib import import_module
+from importlib.util import find_spec, module_from_spec, LazyLoader
+
+def lazy_import( name ):
+	'''a module whose execution is put off until an attribute is used'''
+	try:
+		return sys.modules[ name ]
+	except KeyError:
+		pass
+	spec = find_spec( name )
+	if spec is None:
+		raise ModuleNotFoundError( 'No module named %r' % name, name=name )
+	spec.loader = LazyLoader( spec.loader )
+	module = module_from_spec( spec )
+	sys.modules[ name ] = module
+	spec.loader.exec_module( module )
+	# a real import of a submodule also sets it on its package (which
+	#   find_spec() has imported), and code elsewhere relies on that:
+	#   `import urllib.request; urllib.request.urlopen(...)'
+	parent, _, child = name.rpartition( '.' )
+	if parent:
+		setattr( sys.modules[parent], child, module )
+	return module
+
+def lazy_attributes( namespace, **targets ):
+	'''__getattr__, __dir__ for a module, where each of targets is
+	   'module' or 'module:attribute', imported on first access'''
+	def __getattr__( name ):
+		try:
+			target = targets[ name ]
+		except KeyError:
+			raise AttributeError( 'module %r has no attribute %r' % (
+			                      namespace['__name__'], name) )
+		module, _, attribute = target.partition( ':' )
+		value = import_module( module )
+		if attribute:
+			value = getattr( value, attribute )
+		namespace[ name ] = value
+		return value
+	def __dir__():
+		return sorted( set(namespace) | set(targets) )
+	return __getattr__, __dir__
+
+if __name__ == '__main__':
+	import os
+	import subprocess
+	from time import perf_counter
+	from types import ModuleType
+
+	# lazy_import() defers executing the module...
+	assert 'colorsys' not in sys.modules
+	colorsys = lazy_import( 'colorsys' )
+	# (type() is the one thing we can ask it without loading it)
+	assert 'colorsys' in sys.modules and type( colorsys ) is not ModuleType
+	assert colorsys.rgb_to_hsv( 1, 0, 0 ) == (0, 1, 1)
+	assert type( colorsys ) is ModuleType
+	# a lazy submodule is an attribute of its package, as it would be
+	#   after an ordinary import
+	assert 'xml.dom.minidom' not in sys.modules
+	minidom = lazy_import( 'xml.dom.minidom' )
+	import xml.dom.minidom
+	assert xml.dom.minidom is minidom
+	assert xml.dom.minidom.parseString( '<a/>' ).documentElement.tagName == 'a'
+	try:
+		lazy_import( 'no_such_module' )
+	except ImportError:
+		pass
+	else:
+		assert False
+
+	# ...and lazy_attributes() defers importing it at all
+	import helpers
+	assert 'Decimal' not in vars( helpers )
+	assert str( helpers.Decimal('1.10') + helpers.Decimal('2.20') ) == '3.30'
+	assert 'Decimal' in vars( helpers ) and 'Decimal' in dir( helpers )
+	try:
+		helpers.no_such_helper
+	except AttributeError:
+		pass
+	else:
+		assert False
+
+	# BENCHMARK
+	# cold-import time, each in a fresh interpreter: the standard library
+	#   imports motivation.py makes up front (in their Python 3 names),
+	#   against importing helpers.py and using one helper
+	here = os.path.dirname( os.path.abspath(__file__) )
+	eager = 'import sqlite3, contextlib, itertools, collections, random, ' \
+	        'string, functools, io, decimal, locale, urllib.request'
+	def cold( code, n=20 ):
+		best = float( 'inf' )
+		for _ in range( n ):
+			start = perf_counter()
+			subprocess.check_call( [sys.executable, '-c', code], cwd=here )
+			best = min( best, perf_counter() - start )
+		return best
+	baseline = cold( 'pass' )
+	print( 'eager imports (before): %5.1fms' % ((cold(eager) - baseline) * 1e3) )
+	print( 'helpers.py (after):     %5.1fms' % ((cold(
+	       'import helpers; list(helpers.to_ranges([1,2,3,5]))') - baseline) * 1e3) )
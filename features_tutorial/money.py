@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# this handout picks up from the decimal.localcontext example in
+#   motivation.py
+# Decimal is the right tool for sums of money, but every Decimal is
+#   a full object and every operation consults the current context
+# over millions of holdings, that adds up
+
+# FIXED-POINT ARITHMETIC
+
+# if we know in advance how many decimal places we care about
+#   (e.g., cents, or four places for FX rates) we can store every
+#   amount as an integer count of the smallest unit:
+#   $31.50 at scale 2 is just the integer 3150
+# addition and subtraction of integers is exact, so sums need no
+#   rounding at all
+# multiplication of two amounts at scale s gives an integer at scale 2s,
+#   which we divide back down to scale s, rounding exactly the way
+#   Decimal.quantize() would for the given rounding mode
+
+# as long as the decimal context has enough precision to hold the exact
+#   intermediate results (the default prec of 28 is plenty for money),
+#   the results below are identical to the Decimal results
+# with less precision, Decimal rounds the product (or the running sum)
+#   to prec digits first, and the answers part ways; a FixedContext given
+#   prec= (fixedcontext() passes the active context's) raises
+#   ArithmeticError instead of quietly giving a different answer
+
+from array import array
+from collections.abc import Sequence
+from contextlib import contextmanager
+from decimal import Decimal, getcontext, \
+                    ROUND_DOWN, ROUND_UP, ROUND_HALF_UP, ROUND_HALF_DOWN, \
+                    ROUND_HALF_EVEN, ROUND_FLOOR, ROUND_CEILING, ROUND_05UP
+from functools import total_ordering
+from operator import mul
+
+# round the integer quotient n/d according to a decimal rounding mode
+# we work on magnitudes and put the sign back at the end, which
+#   is how the decimal specification describes these modes
+def rescale( n, d, rounding=ROUND_HALF_EVEN ):
+	'''rescale(n, d, rounding) divides n by d, rounding like Decimal'''
+	negative = n < 0
+	q, r = divmod( -n if negative else n, d )
+	if r:
+		if rounding == ROUND_HALF_EVEN:
+			q += 2*r > d or (2*r == d and q & 1)
+		elif rounding == ROUND_HALF_UP:
+			q += 2*r >= d
+		elif rounding == ROUND_HALF_DOWN:
+			q += 2*r > d
+		elif rounding == ROUND_DOWN:
+			pass
+		elif rounding == ROUND_UP:
+			q += 1
+		elif rounding == ROUND_FLOOR:
+			q += negative
+		elif rounding == ROUND_CEILING:
+			q += not negative
+		elif rounding == ROUND_05UP:
+			q += q % 5 == 0
+		else:
+			raise ValueError( 'unknown rounding mode %r' % rounding )
+	return -q if negative else q
+
+class FixedContext( object ):
+	'''FixedContext(scale, rounding, prec) does arithmetic on scaled integers'''
+	def __init__( self, scale=2, rounding=ROUND_HALF_EVEN, prec=None ):
+		if scale < 0:
+			raise ValueError( 'scale must be non-negative' )
+		self.scale, self.rounding, self.prec = scale, rounding, prec
+		self.unit = 10 ** scale
+		self.quantum = Decimal(1).scaleb( -scale )
+		# exact results at least this big need more than prec digits
+		self.limit = None if prec is None else 10 ** prec
+	def __repr__( self ):
+		return 'FixedContext(scale=%d, rounding=%s, prec=%r)' % (
+		         self.scale, self.rounding, self.prec )
+
+	# precision checks (only with prec=)
+	def _fits( self, n ):
+		if self.limit is not None and not -self.limit < n < self.limit:
+			raise ArithmeticError( '%d needs more than prec=%d digits'
+			                       % (n, self.prec) )
+		return n
+	def _fits_products( self, xs, ys ):
+		'''check every x*y fits, returning xs and ys (as lists, if they were
+		   iterators, since checking them uses them up)'''
+		if self.limit is None:
+			return xs, ys
+		if not isinstance( xs, Sequence ):
+			xs = list( xs )
+		if not isinstance( ys, Sequence ):
+			ys = list( ys )
+		# one bound for the whole of both sequences is usually enough,
+		#   and costs a pass in C rather than a test per element
+		if xs and ys and max( map(abs, xs) ) * max( map(abs, ys) ) >= self.limit:
+			for x, y in zip( xs, ys ):
+				self._fits( x * y )
+		return xs, ys
+
+	# conversions
+	# floats go through str() so that 31.5 means 31.50, not the
+	#   nearest binary fraction
+	def fixed( self, value ):
+		'''convert a Decimal, int, str or float to a scaled integer'''
+		if isinstance( value, float ):
+			value = str( value )
+		value = Decimal( value ).quantize( self.quantum, self.rounding )
+		return int( value.scaleb(self.scale) )
+	def decimal( self, n ):
+		'''convert a scaled integer back to a Decimal'''
+		return Decimal( n ).scaleb( -self.scale )
+	def array( self, values, typecode='q' ):
+		'''convert an iterable of values into a compact array of scaled integers'''
+		return array( typecode, (self.fixed(x) for x in values) )
+
+	# scalar arithmetic
+	def mul( self, x, y ):
+		'''multiply two scaled integers, rounding back to this scale'''
+		return rescale( self._fits(x * y), self.unit, self.rounding )
+	def div( self, x, y ):
+		'''divide two scaled integers, rounding back to this scale'''
+		if y < 0:
+			x, y = -x, -y
+		return self._fits( rescale(x * self.unit, y, self.rounding) )
+
+	# bulk arithmetic
+	# sum() over an array of machine integers never overflows,
+	#   since the running total is a Python int
+	# where the speed comes from (see the benchmark): exact work, like
+	#   weighted(), runs entirely in C and is several times quicker than
+	#   Decimal; dot() rounds in one inlined loop and is about 1.6x
+	#   quicker; multiply() calls rescale() per element, which is about
+	#   as quick as C decimal's quantize(), so it's for exactness, not
+	#   speed; and with prec= every check is another pass over the data
+	# (with prec=, a total is only checked once it's complete: a running
+	#   total that grows past prec and comes back again would be rounded
+	#   by Decimal without our noticing, which takes mixed signs and
+	#   amounts right at the limit)
+	def sum( self, xs ):
+		'''sum scaled integers exactly'''
+		return self._fits( sum(xs) )
+	def multiply( self, xs, ys, typecode='q' ):
+		'''element-wise product of two sequences of scaled integers'''
+		xs, ys = self._fits_products( xs, ys )
+		unit, rounding = self.unit, self.rounding
+		return array( typecode, (rescale(x*y, unit, rounding)
+		                         for x, y in zip(xs, ys)) )
+	def scale_by( self, xs, ns, typecode='q' ):
+		'''element-wise product of scaled integers and plain integers (exact)'''
+		xs, ns = self._fits_products( xs, ns )
+		return array( typecode, map(mul, xs, ns) )
+	def weighted( self, xs, ns ):
+		'''sum of scaled integers times plain integers (exact)'''
+		xs, ns = self._fits_products( xs, ns )
+		return self._fits( sum(map(mul, xs, ns)) )
+	def dot( self, xs, ys ):
+		'''sum of element-wise products, each rounded like multiply()'''
+		xs, ys = self._fits_products( xs, ys )
+		return self._fits( self._dot(xs, ys) )
+	def _dot( self, xs, ys ):
+		unit, rounding = self.unit, self.rounding
+		if rounding == ROUND_HALF_EVEN:
+			# the common case gets an inlined loop
+			total = 0
+			half = unit // 2
+			for x, y in zip(xs, ys):
+				p = x * y
+				q, r = divmod( p if p >= 0 else -p, unit )
+				if r > half or (r == half and not unit & 1 and q & 1):
+					q += 1
+				total += q if p >= 0 else -q
+			return total
+		return sum( rescale(x*y, unit, rounding) for x, y in zip(xs, ys) )
+
+# a context manager in the style of decimal.localcontext: the rounding
+#   mode and the precision default to whatever the active decimal context
+#   uses, so fixed-point results line up with Decimal results in the same
+#   block (or raise, where Decimal would have rounded to fit prec)
+@contextmanager
+def fixedcontext( scale=2, rounding=None, prec=None ):
+	context = getcontext()
+	yield FixedContext( scale, context.rounding if rounding is None else rounding,
+	                    context.prec if prec is None else prec )
+
+# a small immutable value type for when you want to pass single amounts
+#   around instead of arrays
+# amounts added to or subtracted from Money are rounded to its scale,
+#   like Decimal.quantize() on each operand; factors and divisors aren't:
+#   Money('100.00') * Decimal('0.125') is 12.50, as (100 * 0.125)
+#   quantized is, so they're taken exactly and the result rounded once
+# Money compares (and hashes) exactly, by its Decimal value, with Money
+#   of any scale, ints and Decimals; floats and strings aren't amounts:
+#   they're never equal to Money, and ordering against them raises
+#   TypeError (Money('0.10') == 0.1 would need a hash that agreed with
+#   both 0.1 and Decimal('0.10'), and those two aren't equal)
+@total_ordering
+class Money( object ):
+	'''Money(value, context) is an amount stored as a scaled integer'''
+	__slots__ = ('units', 'context')
+	def __init__( self, value=0, context=None, units=None ):
+		context = FixedContext() if context is None else context
+		object.__setattr__( self, 'context', context )
+		object.__setattr__( self, 'units',
+		                    context.fixed(value) if units is None else units )
+	def __setattr__( self, name, value ):
+		raise AttributeError( 'Money is immutable' )
+	def _new( self, units ):
+		return Money( context=self.context, units=units )
+	def _units( self, other ):
+		if isinstance( other, Money ):
+			if other.context.scale != self.context.scale:
+				raise ValueError( 'cannot mix Money of different scales' )
+			return other.units
+		return self.context.fixed( other )
+	def _exact( self, other ):
+		'''other as (integer, exponent), with nothing rounded away'''
+		if isinstance( other, Money ):
+			return other.units, -other.context.scale
+		if isinstance( other, int ):
+			return other, 0
+		if isinstance( other, float ):
+			other = str( other )
+		sign, digits, exponent = Decimal( other ).as_tuple()
+		if not isinstance( exponent, int ):
+			raise ValueError( 'cannot use %r as a factor of Money' % other )
+		n = int( ''.join(map(str, digits)) or 0 )
+		return -n if sign else n, exponent
+	def __add__( self, other ):
+		return self._new( self.units + self._units(other) )
+	__radd__ = __add__
+	def __sub__( self, other ):
+		return self._new( self.units - self._units(other) )
+	def __rsub__( self, other ):
+		return self._new( self._units(other) - self.units )
+	def __neg__( self ):
+		return self._new( -self.units )
+	def __mul__( self, other ):
+		n, exponent = self._exact( other )
+		context = self.context
+		product = context._fits( self.units * n )
+		if exponent >= 0:
+			return self._new( context._fits(product * 10 ** exponent) )
+		return self._new( rescale(product, 10 ** -exponent, context.rounding) )
+	__rmul__ = __mul__
+	def __truediv__( self, other ):
+		n, exponent = self._exact( other )
+		units = self.units
+		if n < 0:
+			units, n = -units, -n
+		if exponent >= 0:
+			quotient = rescale( units, n * 10 ** exponent, self.context.rounding )
+		else:
+			quotient = rescale( units * 10 ** -exponent, n, self.context.rounding )
+		return self._new( self.context._fits(quotient) )
+	def _comparable( self, other ):
+		if isinstance( other, Money ):
+			return other.decimal()
+		if isinstance( other, (int, Decimal) ):
+			return other
+		return None
+	def __eq__( self, other ):
+		other = self._comparable( other )
+		if other is None:
+			return NotImplemented
+		return self.decimal() == other
+	def __lt__( self, other ):
+		other = self._comparable( other )
+		if other is None:
+			return NotImplemented
+		return self.decimal() < other
+	def __hash__( self ):
+		return hash( self.decimal() )
+	def decimal( self ):
+		return self.context.decimal( self.units )
+	def __str__( self ):
+		return str( self.decimal() )
+	def __repr__( self ):
+		return 'Money(%r)' % str( self )
+
+if __name__ == '__main__':
+	from decimal import localcontext
+
+	# every rounding mode agrees with Decimal.quantize
+	modes = (ROUND_DOWN, ROUND_UP, ROUND_HALF_UP, ROUND_HALF_DOWN,
+	         ROUND_HALF_EVEN, ROUND_FLOOR, ROUND_CEILING, ROUND_05UP)
+	for rounding in modes:
+		for n in range(-2000, 2000, 7):
+			expected = (Decimal(n) / 100).quantize( Decimal(1), rounding )
+			assert rescale( n, 100, rounding ) == int( expected )
+
+	fx = FixedContext( 2 )
+	assert fx.fixed( '31.50' ) == fx.fixed( 31.5 ) == 3150
+	assert fx.decimal( 3150 ) == Decimal( '31.50' )
+
+	assert Money( '0.10' ) + Money( '0.20' ) == Money( '0.30' )
+	assert Money( '10.00' ) / 3 == Money( '3.33' )
+	assert Money( '2.50' ) * 3 == Money( '7.50' )
+
+	# factors and divisors are used exactly, and the result rounded once,
+	#   as Decimal would
+	cent = Decimal( '0.01' )
+	for a, b in ( ('100.00', '0.125'), ('10.00', '0.125'), ('31.57', '1.0049'),
+	              ('-2.50', '0.333'), ('7.77', '-12.5'), ('0.05', '1E+2') ):
+		assert ( Money(a) * Decimal(b) ).decimal() == \
+		       ( Decimal(a) * Decimal(b) ).quantize( cent )
+		assert ( Money(a) / Decimal(b) ).decimal() == \
+		       ( Decimal(a) / Decimal(b) ).quantize( cent )
+	assert Money( '100.00' ) * Decimal( '0.125' ) == Money( '12.50' )
+	assert Money( '10.00' ) / Decimal( '0.125' ) == Money( '80.00' )
+	assert Money( '10.00' ) * 0.125 == Money( '1.25' )
+
+	# equal things hash alike, and every comparison works
+	assert Money( '0.10' ) != 0.1 and Money( '0.10' ) != '0.10'
+	assert Money( '0.10' ) == Decimal( '0.1' ) and Money( '3.00' ) == 3
+	assert hash( Money('0.10') ) == hash( Decimal('0.1') )
+	assert hash( Money('3.00') ) == hash( 3 )
+	assert Money( '0.10' ) < Decimal( '0.101' )
+	assert Money( '1.00' ) <= Money( '1.00' ) < Money( '1.01' ) >= Money( '0.99' )
+	assert Money( '0.10' ) == Money( '0.100', FixedContext(3) )
+	assert len( {Money('0.10'), Money('0.100', FixedContext(3)), Decimal('0.1')} ) == 1
+
+	with localcontext() as ctx:
+		ctx.rounding = ROUND_HALF_UP
+		with fixedcontext( 2 ) as fx:
+			assert fx.rounding == ROUND_HALF_UP and fx.prec == ctx.prec
+
+	# with too little precision, Decimal would round the product first;
+	#   the fixed-point context refuses rather than disagree
+	with localcontext() as ctx:
+		ctx.prec = 6
+		with fixedcontext( 2 ) as fx:
+			assert fx.mul( fx.fixed('31.50'), fx.fixed('2.00') ) == 6300
+			assert fx.dot( iter([3150, 100]), iter([200, 50]) ) == 6350
+			for compute in ( lambda: fx.mul(fx.fixed('9999.99'), fx.fixed('9999.99')),
+			                 lambda: fx.dot([999999, 1], [999999, 1]),
+			                 lambda: fx.sum([999999, 999999]) ):
+				try:
+					compute()
+				except ArithmeticError:
+					pass
+				else:
+					assert False
+			assert Decimal( '9999.99' ) * Decimal( '9999.99' ) != \
+			       Decimal( '99999800.0001' )
+
+	# BENCHMARK
+
+	# value a large portfolio, and the same portfolio shifted by a
+	#   per-holding factor (like the MarketScenario example), both with
+	#   Decimal and with scaled integers
+	from random import Random
+	from timeit import timeit
+	rng = Random( 0 )
+	N = 200000
+	prices  = ['%d.%02d' % (rng.randrange(1, 1000), rng.randrange(100))
+	           for _ in range(N)]
+	factors = ['%d.%02d' % (rng.randrange(0, 3), rng.randrange(100))
+	           for _ in range(N)]
+	volumes = [rng.randrange(1, 1000) for _ in range(N)]
+
+	cent = Decimal( '0.01' )
+	dprices, dfactors = [Decimal(x) for x in prices], [Decimal(x) for x in factors]
+	# (checking against prec costs a pass over each sequence, so the
+	#   benchmark is run with and without it)
+	fx, checked = FixedContext( 2 ), FixedContext( 2, prec=getcontext().prec )
+	# (an array is compact, but every value read from one is made into a
+	#   new int, so for speed the scaled integers are kept in lists)
+	fprices = [ fx.fixed(x) for x in prices ]
+	ffactors = [ fx.fixed(x) for x in factors ]
+
+	# market value: no rounding at all, so weighted() is a product and a
+	#   sum done entirely in C
+	def decimal_value():
+		return sum( p*v for p, v in zip(dprices, volumes) )
+	def fixed_value( fx ):
+		return fx.weighted( fprices, volumes )
+	# shifted prices, each rounded to the cent, and summed: dot() does
+	#   the rounding in one inlined loop
+	def decimal_shifted():
+		return sum( (p*f).quantize(cent) for p, f in zip(dprices, dfactors) )
+	def fixed_shifted( fx ):
+		return fx.dot( fprices, ffactors )
+	# shifted prices times volumes: multiply() calls rescale() for every
+	#   element, which is little quicker than C decimal's own quantize()
+	def decimal_scenario():
+		return sum( (p*f).quantize(cent) * v
+		            for p, f, v in zip(dprices, dfactors, volumes) )
+	def fixed_scenario( fx ):
+		return fx.weighted( fx.multiply(fprices, ffactors), volumes )
+
+	best = lambda func: min( timeit(func, number=1) for _ in range(3) )
+	print( '%-14s %8s %8s %8s' % ('', 'decimal', 'fixed', 'checked') )
+	for label, dec, fix in (('value', decimal_value, fixed_value),
+	                        ('shifted', decimal_shifted, fixed_shifted),
+	                        ('shifted value', decimal_scenario, fixed_scenario)):
+		assert fx.decimal( fix(fx) ) == fx.decimal( fix(checked) ) == dec()
+		print( '%-14s %7.3fs %7.3fs %7.3fs' % (label, best(dec),
+		       best(lambda: fix(fx)), best(lambda: fix(checked))) )
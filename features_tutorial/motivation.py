@@ -7,6 +7,8 @@
 # 2. comprehensions, generators & generator expressions
 # 3. decorators
 # 4. context managers
+# (helpers.py collects the reusable helpers defined here, without
+#   running any of the examples, for code that just wants to import them)
 
 # FUNCTIONAL PROGRAMMING
 
@@ -1090,6 +1092,12 @@ assert 0.14285 < Decimal(1)   / 7   < 0.14286
 assert 3.14159 < Decimal(355) / 113 < 3.14160
 assert (Decimal(355)/113) - (Decimal(1)/7) != 3.0
 
+# when the number of decimal places is fixed in advance (e.g., cents),
+#   scaled integers give the same answers; over large portfolios, exact
+#   sums of products are several times faster and sums of rounded
+#   products about 1.6x faster, but rounding each element in Python is
+#   no faster than C decimal; see money.py
+
 # we may have a programme that needs to display information
 #   for users in different locales
 # locales are are managed globally so it would be very 
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# lightning.md: to create an immutable type, subclass an immutable type
+#   like tuple, and override __new__ (by the time __init__ runs, the
+#   object already exists, and setting anything then would defeat the
+#   point); namedtuple does exactly this, and motivation.py uses it for
+#   Employee and Stock
+# when we hold tens of millions of these, a few things matter:
+#   1. no per-instance __dict__ (namedtuple already manages this)
+#   2. the field values: rows read from a file get a fresh copy of every
+#      string, so ten million stocks in five sectors hold ten million
+#      sector strings; interning those fields keeps one copy of each
+#   3. hashing: a tuple hashes all its fields every time it's hashed;
+#      records used as dict keys or set members over and over can keep
+#      their hash instead
+#   4. getting them on and off disk one at a time: a fixed struct layout
+#      is much smaller than a pickle per record, and record n is always
+#      at offset n * size (a single pickle of a whole list can still be
+#      smaller, since it shares repeated strings)
+
+# record( 'Stock', 'ticker sector price volume' ) makes either
+#   kind='tuple': a tuple subclass, like namedtuple (a tuple subclass
+#     can't have slots of its own, so there's nowhere to keep a hash)
+#   kind='slots': a class with __slots__, one per field plus one for the
+#     hash, which is worked out the first time it's asked for
+# either way, intern= names the (string) fields to intern, and format=
+#   gives a struct code per field ('s' fields hold UTF-8 strings) for
+#   pack(), unpack(), pack_many() and iter_unpack(); pack() raises
+#   ValueError for a string that doesn't fit its field in UTF-8 or ends
+#   in a NUL, rather than write something that unpacks differently
+
+import sys
+from operator import attrgetter, itemgetter
+from struct import Struct
+
+try:
+	from _collections import _tuplegetter
+except ImportError:
+	_tuplegetter = lambda index, doc: property( itemgetter(index), doc=doc )
+
+def _split( names ):
+	if isinstance( names, str ):
+		names = names.replace( ',', ' ' ).split()
+	return tuple( names )
+
+def _serialisation( cls, fields, format ):
+	'''add pack/unpack methods for a struct layout, one code per field'''
+	layout = Struct( '<' + ''.join(format) )
+	# (index, width) of the string fields: struct would quietly cut a
+	#   longer string short (maybe in the middle of a UTF-8 character),
+	#   and pads a shorter one with NULs, which unpack() strips, so a
+	#   string that's too long or ends in a NUL is refused
+	strings = [ (i, int(code[:-1] or 1)) for i, code in enumerate(format)
+	            if code.endswith('s') ]
+	def pack( self ):
+		values = list( self._values() )
+		for i, width in strings:
+			encoded = values[ i ] = values[ i ].encode( 'utf-8' )
+			if len( encoded ) > width:
+				raise ValueError( '%s.%s is %d bytes in UTF-8, the field holds %d'
+				                  % (type(self).__name__, fields[i], len(encoded),
+				                     width) )
+			if encoded.endswith( b'\0' ):
+				raise ValueError( "%s.%s ends in a NUL, which wouldn't unpack"
+				                  % (type(self).__name__, fields[i]) )
+		return layout.pack( *values )
+	def decode( values ):
+		values = list( values )
+		for i, _ in strings:
+			values[ i ] = values[ i ].rstrip( b'\0' ).decode( 'utf-8' )
+		return cls( *values )
+	def unpack( cls, data ):
+		return decode( layout.unpack(data) )
+	def pack_many( cls, records ):
+		return b''.join( map(pack, records) )
+	def iter_unpack( cls, data ):
+		return map( decode, layout.iter_unpack(data) )
+	cls._struct = layout
+	cls.pack = pack
+	cls.unpack = classmethod( unpack )
+	cls.pack_many = classmethod( pack_many )
+	cls.iter_unpack = classmethod( iter_unpack )
+
+def record( typename, fields, kind='tuple', intern=(), format=None ):
+	'''record(typename, fields) -> an immutable record class'''
+	fields, intern = _split( fields ), set( _split(intern) )
+	if kind not in ('tuple', 'slots'):
+		raise ValueError( "kind must be 'tuple' or 'slots'" )
+	if format is not None:
+		format = _split( format )
+		if len(format) != len(fields):
+			raise ValueError( 'one struct code per field' )
+	arguments = ', '.join( fields )
+	values = ', '.join( '_intern(%s)' % f if f in intern else f for f in fields )
+	namespace = { '_intern': sys.intern, '_tuple_new': tuple.__new__ }
+
+	if kind == 'tuple':
+		exec( 'def __new__( _cls, %s ):\n'
+		      '\treturn _tuple_new( _cls, (%s,) )\n' % (arguments, values),
+		      namespace )
+		body = { '__slots__': (), '__new__': namespace['__new__'] }
+		for i, name in enumerate( fields ):
+			body[ name ] = _tuplegetter( i, 'field %d: %s' % (i, name) )
+		cls = type( typename, (_Tupled,), body )
+	else:
+		cls = type( typename, (_Slotted,), { '__slots__': fields + ('_hash',) } )
+		# the slot descriptors' own __set__ gets around our __setattr__
+		for name in fields:
+			namespace[ '_set_' + name ] = cls.__dict__[ name ].__set__
+		exec( 'def __init__( self, %s ):\n' % arguments +
+		      ''.join( '\t_set_%s( self, %s )\n' % (f, v) for f, v in
+		               zip(fields, values.split(', ')) ),
+		      namespace )
+		cls.__init__ = namespace[ '__init__' ]
+		getter = attrgetter( *fields )
+		cls._values = ( lambda self: getter(self) ) if len(fields) > 1 else \
+		              ( lambda self: (getter(self),) )
+	cls._fields = fields
+	cls.__module__ = sys._getframe( 1 ).f_globals.get( '__name__', '__main__' )
+	if format is not None:
+		_serialisation( cls, fields, format )
+	return cls
+
+class _Record( object ):
+	'''what every record has in common, given _fields and _values()'''
+	__slots__ = ()
+	def __repr__( self ):
+		return '%s(%s)' % ( type(self).__name__, ', '.join(
+		       '%s=%r' % x for x in zip(self._fields, self._values())) )
+	def _replace( self, **changes ):
+		return type( self )( *(changes.pop(f, v) for f, v in
+		                     zip(self._fields, self._values())) )
+	def _asdict( self ):
+		return dict( zip(self._fields, self._values()) )
+
+class _Tupled( _Record, tuple ):
+	'''kind='tuple': the tuple does the rest'''
+	__slots__ = ()
+	_values = tuple.__iter__
+	def __getnewargs__( self ):
+		return tuple( self )
+
+class _Slotted( _Record ):
+	'''kind='slots': equality, hashing and pickling by field values'''
+	__slots__ = ()
+	def __setattr__( self, name, value ):
+		raise AttributeError( "can't set attribute %r of %s" % (
+		                      name, type(self).__name__) )
+	__delattr__ = __setattr__
+	def __iter__( self ):
+		return iter( self._values() )
+	def __len__( self ):
+		return len( self._fields )
+	def __eq__( self, other ):
+		if type( other ) is not type( self ):
+			return NotImplemented
+		return self._values() == other._values()
+	def __hash__( self ):
+		try:
+			return self._hash
+		except AttributeError:
+			h = hash( self._values() )
+			type( self )._hash.__set__( self, h )
+			return h
+	def __reduce__( self ):
+		return type( self ), tuple( self._values() )
+
+if __name__ == '__main__':
+	import pickle
+	import tracemalloc
+	from collections import namedtuple
+	from timeit import timeit
+
+	for kind in ( 'tuple', 'slots' ):
+		Stock = record( 'Stock', 'ticker sector price volume', kind=kind,
+		                intern='sector', format='8s 16s d q' )
+		s = Stock( 'ADBE', 'infotech', 31.5, 870 )
+		assert (s.ticker, s.sector, s.price, s.volume) == ('ADBE', 'infotech', 31.5, 870)
+		ticker, sector, price, volume = s
+		assert ticker == 'ADBE' and len( s ) == 4
+		assert s == Stock( 'ADBE', 'infotech', 31.5, 870 )
+		assert s != Stock( 'ADBE', 'infotech', 31.5, 871 )
+		assert hash( s ) == hash( Stock('ADBE', 'infotech', 31.5, 870) )
+		assert len( {s, Stock('ADBE', 'infotech', 31.5, 870)} ) == 1
+		try:
+			s.price = 0
+		except AttributeError:
+			pass
+		else:
+			assert False
+		assert Stock( 'F', ''.join(['con', 'sumer']), 10.5, 540 ).sector is \
+		       Stock( 'CPB', ''.join(['consu', 'mer']), 31.6, 250 ).sector
+		assert pickle.loads( pickle.dumps(s) ) == s
+		assert Stock.unpack( s.pack() ) == s and len( s.pack() ) == 40
+		many = [ s, Stock('GOOG', 'infotech', 579.8, 350) ]
+		assert list( Stock.iter_unpack(Stock.pack_many(many)) ) == many
+		assert s._asdict()[ 'volume' ] == 870
+		assert repr( s ) == "Stock(ticker='ADBE', sector='infotech', price=31.5, volume=870)"
+		assert s._replace( price=32. ) == Stock( 'ADBE', 'infotech', 32., 870 )
+		for ticker in ( 'BERKSHIRE.B', 'a\xc4\xc4\xc4\xe9', 'ADBE\0' ):
+			try:
+				Stock( ticker, 'financials', 1., 1 ).pack()
+			except ValueError:
+				pass
+			else:
+				assert False
+		assert Stock.unpack( Stock('\xc4\xc4\xc4\xc4', 'x', 1., 1).pack() ).ticker == \
+		       '\xc4\xc4\xc4\xc4'
+
+	# BENCHMARK
+	# rows as they come out of a file: the sector string is parsed afresh
+	#   for every row, so only interning keeps one copy of each
+	sectors = [ 'infotech', 'health', 'financials', 'industrials', 'consumer' ]
+	lines = [ 'T%d,%s,%d' % (i, sectors[i % 5], i) for i in range(200000) ]
+	kinds = [ ('namedtuple', namedtuple('Stock', 'ticker sector price volume')),
+	          ('record, tuple', record('Stock', 'ticker sector price volume',
+	                                   intern='sector')),
+	          ('record, slots', record('Stock', 'ticker sector price volume',
+	                                   kind='slots', intern='sector')) ]
+	for label, Stock in kinds:
+		def build():
+			rv = []
+			for line in lines:
+				ticker, sector, volume = line.split( ',' )
+				rv.append( Stock(ticker, sector, 1., int(volume)) )
+			return rv
+		tracemalloc.start()
+		built = build()
+		size, _ = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		del built
+		rate = len( lines ) / timeit( build, number=1 )
+		print( '%-14s %5.1f bytes each (with fields), %4.2fM built/s' % (
+		       label, size / len(lines), rate / 1e6) )
+
+	# a Python-level __hash__ is slower than tuple's for a few small
+	#   fields; keeping the hash pays off once the fields are costly to
+	#   hash, like a price history
+	Prices = namedtuple( 'Prices', 'ticker history' )
+	SlottedPrices = record( 'Prices', 'ticker history', kind='slots' )
+	history = tuple( float(i) for i in range(100) )
+	for label, Prices in (('namedtuple', Prices), ('record, slots', SlottedPrices)):
+		records = [ Prices('T%d' % i, history) for i in range(10000) ]
+		print( '%-14s hashed x10: %.3fs' % (label, timeit(
+		       lambda: [hash(r) for r in records], number=10)) )
+
+	Stock = record( 'Stock', 'ticker sector price volume', format='8s 12s d q' )
+	records = [ Stock('T%d' % i, sectors[i % 5], float(i), i) for i in range(200000) ]
+	pickled = pickle.dumps( records, pickle.HIGHEST_PROTOCOL )
+	packed = Stock.pack_many( records )
+	assert pickle.loads( pickled ) == list( Stock.iter_unpack(packed) ) == records
+	print( 'pickle:   %8d bytes, dumps %.3fs, loads %.3fs' % ( len(pickled),
+	       timeit(lambda: pickle.dumps(records, pickle.HIGHEST_PROTOCOL), number=1),
+	       timeit(lambda: pickle.loads(pickled), number=1)) )
+	print( 'struct:   %8d bytes, packs %.3fs, unpacks %.3fs' % ( len(packed),
+	       timeit(lambda: Stock.pack_many(records), number=1),
+	       timeit(lambda: list(Stock.iter_unpack(packed)), number=1)) )
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# notes.md has a fizzbuzz generator:
+#   def fizzbuzz():
+#       for x in count():
+#           if x % 3 == 0:
+#               yield 'fizz',
+#           elif x % 5 == 0:
+#               yield 'buzz',
+#           else:
+#               yield str(x)
+# the same shape shows up whenever we tag integer ids by rules of the
+#   form `divisible by d -> label': a chain of modulo tests per element
+
+# but the answer for x only depends on x modulo the least common
+#   multiple of the divisors (15, for fizzbuzz), so we can work out
+#   that many answers once, up front, and after that every label is
+#   a single index into a table
+
+from array import array
+from functools import reduce
+from itertools import count, islice
+from math import gcd
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+def lcm( *xs ):
+	return reduce( lambda a, b: a * b // gcd(a, b), xs, 1 )
+
+class RuleEngine( object ):
+	'''RuleEngine(rules, default, combine) labels integers by (divisor, label) rules'''
+	# combine=False: the first matching rule wins, like the elif chain
+	#   in notes.md (15 is 'fizz')
+	# combine=True:  the labels of all matching rules are joined, like
+	#   the usual fizzbuzz (15 is 'fizzbuzz')
+	# default(x) labels numbers that match no rule
+	# if the period would be larger than max_period, we don't build a
+	#   table and fall back to testing the rules one by one
+	def __init__( self, rules, default=str, combine=False, max_period=1<<20 ):
+		self.rules = tuple( (int(d), label) for d, label in rules )
+		if any( d <= 0 for d, _ in self.rules ):
+			raise ValueError( 'divisors must be positive' )
+		self.default, self.combine = default, combine
+		self.period = lcm( *(d for d, _ in self.rules) )
+		self.labels = [None]  # code 0 means `no rule matched'
+		self.table = None
+		if self.period <= max_period:
+			codes, index = [], {}
+			for r in range(self.period):
+				label = self._match( r )
+				if label is not None and label not in index:
+					index[ label ] = len( self.labels )
+					self.labels.append( label )
+				codes.append( 0 if label is None else index[label] )
+			self.table = array( 'B' if len(self.labels) < 256 else 'H'
+			                    if len(self.labels) < 65536 else 'L', codes )
+			# the table as labels, for the scalar path
+			self._label_table = [self.labels[c] for c in codes]
+
+	# the rules applied the slow way: used to build the table
+	def _match( self, x ):
+		if self.combine:
+			matched = [label for d, label in self.rules if x % d == 0]
+			return ''.join( matched ) if matched else None
+		for d, label in self.rules:
+			if x % d == 0:
+				return label
+		return None
+
+	def label( self, x ):
+		'''the label for a single integer'''
+		if self.table is None:
+			label = self._match( x )
+		else:
+			label = self._label_table[ x % self.period ]
+		return self.default( x ) if label is None else label
+
+	def __call__( self, x ):
+		return self.label( x )
+
+	def __iter__( self ):
+		return self.iterlabels()
+
+	def iterlabels( self, start=0 ):
+		'''labels for start, start+1, start+2, ... forever'''
+		if self.table is None:
+			for x in count( start ):
+				yield self.label( x )
+			return
+		table, default, period = self._label_table, self.default, self.period
+		x = start
+		r = start % period
+		while True:
+			for label in islice( table, r, None ):
+				yield default( x ) if label is None else label
+				x += 1
+			r = 0
+
+	# vectorised paths: instead of labels, these give label codes
+	#   (indexes into self.labels, with 0 meaning `no rule'), which is
+	#   what you want for counting, filtering, or joining against
+	#   other arrays
+	def codes( self, start, n ):
+		'''label codes for the block [start, start+n), as an array'''
+		if self.table is None:
+			index = {label: i for i, label in enumerate(self.labels)}
+			codes = []
+			for x in range(start, start + n):
+				label = self._match( x )
+				if label is not None and label not in index:
+					index[ label ] = len( self.labels )
+					self.labels.append( label )
+				codes.append( 0 if label is None else index[label] )
+			return array( 'L', codes )
+		# rotate the table to start at start % period, then tile it
+		# repeating an array is a C-level copy, not a loop over elements
+		table, period = self.table, self.period
+		r = start % period
+		block = table[ r: ] + table[ :r ]
+		reps, extra = divmod( n, period )
+		return block * reps + block[ :extra ]
+
+	def codes_for( self, ids ):
+		'''label codes for an arbitrary sequence (or numpy array) of ids'''
+		if self.table is None:
+			raise ValueError( 'period too large for table lookup' )
+		if numpy is not None:
+			table = numpy.frombuffer( self.table, dtype='u%d' % self.table.itemsize )
+			return table[ numpy.asarray(ids) % self.period ]
+		table, period = self.table, self.period
+		return array( table.typecode, [table[x % period] for x in ids] )
+
+	def block( self, start, n ):
+		'''labels for the block [start, start+n), as a list'''
+		labels, default = self.labels, self.default
+		return [labels[c] if c else default(x)
+		        for x, c in zip(range(start, start + n), self.codes(start, n))]
+
+# fizzbuzz from notes.md, now by table lookup
+def fizzbuzz():
+	return iter( RuleEngine([(3, 'fizz'), (5, 'buzz')]) )
+
+if __name__ == '__main__':
+	from timeit import timeit
+
+	def notes_fizzbuzz():
+		for x in count():
+			if x % 3 == 0:
+				yield 'fizz'
+			elif x % 5 == 0:
+				yield 'buzz'
+			else:
+				yield str(x)
+
+	assert list(islice(fizzbuzz(), 100)) == list(islice(notes_fizzbuzz(), 100))
+
+	fb = RuleEngine( [(3, 'fizz'), (5, 'buzz')], combine=True )
+	assert fb.period == 15
+	assert [fb(x) for x in (1, 3, 5, 15)] == ['1', 'fizz', 'buzz', 'fizzbuzz']
+	assert list(islice(fb.iterlabels(13), 4)) == ['13', '14', 'fizzbuzz', '16']
+	assert fb.block( 9, 7 ) == ['fizz','buzz','11','fizz','13','14','fizzbuzz']
+	assert list( fb.codes(0, 1000) ) == list( fb.codes_for(range(1000)) )
+	assert fb.block( 1000, 500 ) == [fb(x) for x in range(1000, 1500)]
+
+	# too large a period: same answers, the slow way
+	big = RuleEngine( [(3, 'fizz'), (5, 'buzz')], combine=True, max_period=10 )
+	assert big.table is None
+	assert big.block( 1000, 500 ) == fb.block( 1000, 500 )
+
+	# BENCHMARK
+	n = 1000000
+	print( 'modulo chain: %.3fs' % timeit(
+	         lambda: list(islice(notes_fizzbuzz(), n)), number=1) )
+	print( 'iterlabels:   %.3fs' % timeit(
+	         lambda: list(islice(fizzbuzz(), n)), number=1) )
+	print( 'codes:        %.3fs' % timeit(
+	         lambda: fb.codes(0, n), number=1) )
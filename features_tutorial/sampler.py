@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# guided_debugging.md sets up a SIGUSR2 (or SIGALRM) handler that drops
+#   into pdb, to see where a process that runs forever has got to
+# on a server there's no terminal to drop into, and stopping the process
+#   is often exactly what we can't do
+# instead, we can look at where *every* thread is, many times a second,
+#   with sys._current_frames(), and count how often each stack comes up:
+#   the stacks that come up most are where the time goes
+# the counts are written out in the `folded' format that flamegraph.pl,
+#   speedscope and friends read: one line per distinct stack,
+#     thread;outer (file.py:12);inner (file.py:40) 17
+
+# there are two ways to drive the sampling:
+#   clock='wall': a background thread wakes every interval; this sees
+#     threads that are blocked (in sleep, I/O, waiting on a lock) too
+#   clock='cpu':  setitimer(ITIMER_PROF) sends SIGPROF every interval of
+#     CPU time the process uses, so an idle process isn't sampled at all
+#     (signals are delivered to the main thread, so this one has to be
+#     started from there)
+# and install() hooks up a signal, like the handler in
+#   guided_debugging.md: the first SIGUSR2 starts sampling a running
+#   process, the next one stops it and writes the file
+
+import signal
+import sys
+import threading
+from collections import Counter
+from os.path import basename
+from time import sleep
+
+class Sampler( object ):
+	'''Sampler(interval, clock) counts the stacks of all threads'''
+	def __init__( self, interval=.005, clock='wall' ):
+		if clock not in ('wall', 'cpu'):
+			raise ValueError( "clock must be 'wall' or 'cpu'" )
+		self.interval, self.clock = interval, clock
+		self.stacks = Counter()     # (thread name, label, ...) -> samples
+		self.samples = 0
+		self._labels = {}           # code object -> label
+		self._names = {}            # thread ident -> thread name
+		self._running = False
+		self._thread = None
+		self._previous = None       # the SIGPROF handler we replaced
+
+	def _label( self, code ):
+		label = self._labels[ code ] = '%s (%s:%d)' % (
+		        code.co_name, basename(code.co_filename), code.co_firstlineno)
+		return label
+
+	def _name( self, ident ):
+		names = self._names
+		if ident not in names:
+			names.update( (t.ident, t.name) for t in threading.enumerate() )
+			names.setdefault( ident, str(ident) )  # not a threading.Thread
+		return names[ ident ]
+
+	def sample( self, frames, skip=None ):
+		'''count one stack for each thread in {ident: frame}'''
+		labels, stacks = self._labels, self.stacks
+		for ident, frame in frames.items():
+			if ident == skip:
+				continue
+			stack = []
+			while frame is not None:
+				code = frame.f_code
+				stack.append( labels.get(code) or self._label(code) )
+				frame = frame.f_back
+			stack.append( self._name(ident) )
+			stack.reverse()
+			stacks[ tuple(stack) ] += 1
+		self.samples += 1
+
+	# the two drivers
+	def _loop( self ):
+		me = threading.get_ident()
+		while self._running:
+			self.sample( sys._current_frames(), skip=me )
+			sleep( self.interval )
+
+	def _on_sigprof( self, signum, frame ):
+		# the main thread's entry in _current_frames() would be this
+		#   handler; the frame it interrupted is the one we want
+		frames = sys._current_frames()
+		frames[ threading.main_thread().ident ] = frame
+		self.sample( frames )
+
+	def start( self ):
+		if self._running:
+			return self
+		self._running = True
+		if self.clock == 'wall':
+			self._thread = threading.Thread( target=self._loop,
+			                                 name='sampler', daemon=True )
+			self._thread.start()
+		else:
+			self._previous = signal.signal( signal.SIGPROF, self._on_sigprof )
+			signal.setitimer( signal.ITIMER_PROF, self.interval, self.interval )
+		return self
+
+	def stop( self ):
+		if not self._running:
+			return self
+		self._running = False
+		if self.clock == 'wall':
+			self._thread.join()
+			self._thread = None
+		else:
+			signal.setitimer( signal.ITIMER_PROF, 0 )
+			signal.signal( signal.SIGPROF, self._previous )
+		return self
+
+	def __enter__( self ):
+		return self.start()
+	def __exit__( self, *exc ):
+		self.stop()
+
+	# output
+	def folded( self ):
+		'''the samples, one `stack count' line per distinct stack'''
+		return [ '%s %d' % (';'.join(stack), n)
+		         for stack, n in sorted(self.stacks.items()) ]
+
+	def write( self, path ):
+		with open( path, 'w' ) as f:
+			for line in self.folded():
+				f.write( line + '\n' )
+
+def install( path, signum=signal.SIGUSR2, interval=.005, clock='wall' ):
+	'''toggle sampling of this process on signum, writing path on each stop'''
+	state = {}
+	def handler( signum, frame ):
+		sampler = state.pop( 'sampler', None )
+		if sampler is None:
+			state[ 'sampler' ] = Sampler( interval, clock ).start()
+		else:
+			sampler.stop().write( path )
+	return signal.signal( signum, handler )
+
+if __name__ == '__main__':
+	import os
+	import tempfile
+	from time import perf_counter
+
+	def spin( seconds ):
+		end = perf_counter() + seconds
+		while perf_counter() < end:
+			pass
+	def waiting( event ):
+		event.wait()
+
+	# wall clock: the blocked thread shows up as well as the busy one
+	done = threading.Event()
+	waiter = threading.Thread( target=waiting, args=(done,), name='waiter' )
+	waiter.start()
+	with Sampler( .001 ) as sampler:
+		spin( .2 )
+	done.set()
+	waiter.join()
+	assert sampler.samples > 20
+	threads = { stack[0] for stack in sampler.stacks }
+	assert 'MainThread' in threads and 'waiter' in threads
+	assert 'sampler' not in threads
+	assert any( stack[-1].startswith('spin ') for stack in sampler.stacks )
+	assert any( 'waiting (' in label
+	            for stack in sampler.stacks for label in stack )
+
+	# cpu clock: sleeping doesn't get sampled, spinning does
+	with Sampler( .001, clock='cpu' ) as sampler:
+		sleep( .1 )
+		idle = sampler.samples
+		spin( .1 )
+	assert idle <= 5 < sampler.samples
+	assert signal.getsignal( signal.SIGPROF ) in (signal.SIG_DFL, None)
+
+	# started and stopped from outside, and written to a file
+	path = os.path.join( tempfile.mkdtemp(), 'stacks.folded' )
+	install( path )
+	os.kill( os.getpid(), signal.SIGUSR2 )
+	spin( .1 )
+	os.kill( os.getpid(), signal.SIGUSR2 )
+	with open( path ) as f:
+		lines = f.read().splitlines()
+	assert lines and all( line.rsplit(' ', 1)[1].isdigit() for line in lines )
+	assert any( 'spin (' in line for line in lines )
+	os.remove( path )
+	os.rmdir( os.path.dirname(path) )
+
+	# BENCHMARK
+	# how much a busy thread slows down while it's being sampled
+	def work():
+		start = perf_counter()
+		sum( i * i for i in range(2000000) )
+		return perf_counter() - start
+	for interval in (.01, .001):
+		unsampled = min( work() for _ in range(5) )
+		with Sampler( interval ):
+			sampled = min( work() for _ in range(5) )
+		print( 'sampling every %4.1fms: %+5.1f%% run time' % (
+		       interval * 1e3, (sampled / unsampled - 1) * 100) )
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# notes.md has a generator to get a random sample of lines from any iterable:
+#   def randlines( iterable, n):
+#       for line in iterable:
+#           if randint(0, n) == 0:
+#               yield line
+# every line is kept with probability 1/(n+1), so the size of the sample
+#   depends on the size of the input: a few lines from a small file,
+#   millions from a big one
+# usually we want exactly k lines, each equally likely, without knowing
+#   the length of the stream in advance: this is reservoir sampling
+
+import random as _random
+from heapq import heapify, heapreplace
+from itertools import islice
+from math import exp, floor, log
+
+# Algorithm L (Li, 1994)
+# the naive reservoir (Algorithm R) draws a random number for every
+#   element; Algorithm L instead computes how many elements to skip
+#   before the next one that enters the reservoir
+# the skipping happens in islice(), in C, so the skipped elements are
+#   never touched by Python code, and if `parse` is given it is only
+#   applied to the k elements that end up in the sample
+def reservoir_sample( iterable, k, parse=None, rng=_random ):
+	'''reservoir_sample(iterable, k) -> a uniform sample of k elements'''
+	it = iter( iterable )
+	reservoir = list( islice(it, k) )
+	if len(reservoir) == k and k > 0:
+		random, randrange = rng.random, rng.randrange
+		# 1. - random() is in (0, 1], so log() never sees a zero
+		w = exp( log(1. - random()) / k )
+		while True:
+			if w >= 1.:
+				break
+			skip = floor( log(1. - random()) / log(1. - w) )
+			for x in islice( it, skip, skip + 1 ):
+				reservoir[ randrange(k) ] = x
+				break
+			else:
+				break
+			w *= exp( log(1. - random()) / k )
+	if parse is not None:
+		reservoir = [parse(x) for x in reservoir]
+	return reservoir
+
+# a drop-in for randlines() from notes.md, with an exact sample size
+def randlines( iterable, n, rng=_random ):
+	for line in reservoir_sample( iterable, n, rng=rng ):
+		yield line
+
+# WEIGHTED SAMPLING
+
+# Algorithm A-Res (Efraimidis & Spirakis, 2006): give each element the
+#   key u**(1/w) for u uniform in (0, 1], and keep the k largest keys
+# we compare log(u)/w instead, which orders the same way but doesn't
+#   underflow for large weights
+def weighted_sample( iterable, k, weight, rng=_random ):
+	'''weighted_sample(iterable, k, weight) -> k elements, chosen in proportion to weight(x)'''
+	random = rng.random
+	heap = []  # (key, tiebreak, element), smallest key on top
+	for i, x in enumerate( iterable ):
+		w = weight( x )
+		if w <= 0:
+			continue
+		key = log( 1. - random() ) / w
+		if len(heap) < k:
+			heap.append( (key, i, x) )
+			if len(heap) == k:
+				heapify( heap )
+		elif key > heap[0][0]:
+			heapreplace( heap, (key, i, x) )
+	return [x for _, _, x in sorted( heap, reverse=True )]
+
+# STRATIFIED SAMPLING
+
+# a separate reservoir for every value of key(x), so that rare strata
+#   are represented even when one stratum dominates the stream
+# k may be a number (the same for every stratum) or a dict of per
+#   stratum sizes (strata not in the dict are skipped)
+def stratified_sample( iterable, key, k, rng=_random ):
+	'''stratified_sample(iterable, key, k) -> {stratum: uniform sample}'''
+	randrange = rng.randrange
+	sizes = k if isinstance( k, dict ) else None
+	reservoirs, seen = {}, {}
+	for x in iterable:
+		s = key( x )
+		n = seen.get( s, 0 )
+		size = k if sizes is None else sizes.get( s, 0 )
+		if n < size:
+			reservoirs.setdefault( s, [] ).append( x )
+		elif size:
+			j = randrange( n + 1 )
+			if j < size:
+				reservoirs[ s ][ j ] = x
+		seen[ s ] = n + 1
+	return reservoirs
+
+# SAMPLING FILES WITHOUT READING THEM
+
+# any reservoir has to read the whole stream; for a multi-gigabyte file
+#   on disk we can do better by jumping to random byte offsets
+# picking a random byte and taking the line it falls in favours long
+#   lines (a line twice as long is twice as likely to be hit), so we
+#   accept a hit with probability min_length/len(line), which makes
+#   every line equally likely as long as no line is shorter than
+#   min_length (counting its newline)
+# with uniform=False we skip the correction: faster, but biased
+#   towards long lines
+# if there turn out not to be k distinct lines after max_attempts
+#   random offsets (by default, 1000 per requested line), we give up
+from mmap import mmap, ACCESS_READ
+def file_sample( path, k, uniform=True, min_length=1, max_attempts=None,
+                 rng=_random ):
+	'''file_sample(path, k) -> k distinct lines (as bytes) from random offsets'''
+	random, randrange = rng.random, rng.randrange
+	if max_attempts is None:
+		max_attempts = 1000 * k
+	with open( path, 'rb' ) as f:
+		size = f.seek( 0, 2 )
+		if not size:
+			if k:
+				raise ValueError( 'file has fewer than %d lines' % k )
+			return []
+		mm = mmap( f.fileno(), 0, access=ACCESS_READ )
+	with mm:
+		starts = {}
+		attempts = 0
+		while len(starts) < k and attempts < max_attempts:
+			attempts += 1
+			offset = randrange( size )
+			start = mm.rfind( b'\n', 0, offset ) + 1
+			if start in starts:
+				continue
+			end = mm.find( b'\n', offset )
+			end = size if end < 0 else end
+			if uniform and random() * (end - start + 1) >= min_length:
+				continue
+			starts[ start ] = mm[ start:end ]
+		if len(starts) < k:
+			raise ValueError( 'file has fewer than %d lines' % k )
+		return list( starts.values() )
+
+if __name__ == '__main__':
+	from collections import Counter
+	from os import remove
+	from tempfile import mkstemp
+	from timeit import timeit
+
+	rng = _random.Random( 0 )
+
+	assert len( reservoir_sample(range(1000000), 10, rng=rng) ) == 10
+	assert sorted( reservoir_sample(range(5), 10, rng=rng) ) == [0,1,2,3,4]
+	assert len( list(randlines(iter(range(100)), 7, rng=rng)) ) == 7
+
+	# every element is equally likely
+	counts = Counter()
+	for _ in range(20000):
+		counts.update( reservoir_sample(range(20), 5, rng=rng) )
+	assert all( 4500 < c < 5500 for c in counts.values() )
+
+	# heavier elements are chosen more often
+	counts = Counter()
+	for _ in range(10000):
+		counts.update( weighted_sample('abc', 1, {'a': 1, 'b': 2, 'c': 7}.get, rng=rng) )
+	assert counts['a'] < counts['b'] < counts['c']
+
+	# every stratum is represented
+	data = ['common'] * 100000 + ['rare'] * 10
+	sample = stratified_sample( data, lambda x: x, 5, rng=rng )
+	assert len( sample['common'] ) == len( sample['rare'] ) == 5
+
+	# lines sampled from a file with lines of very different lengths
+	_, filename = mkstemp()
+	with open( filename, 'wb' ) as f:
+		for i in range(1000):
+			f.write( (b'%d ' % i) * (1 if i % 2 else 50) + b'\n' )
+	counts = Counter()
+	for _ in range(300):
+		lines = file_sample( filename, 10, min_length=3, rng=rng )
+		assert len(set(lines)) == 10
+		counts.update( len(x) < 10 for x in lines )
+	assert .4 < counts[True] / 3000. < .6  # short lines aren't under-represented
+	remove( filename )
+
+	# BENCHMARK
+	lines = ['%d,%d,%d' % (i, i*i, i*3) for i in range(1000000)]
+	parse = lambda line: [int(x) for x in line.split(',')]
+	def algorithm_r( iterable, k ):
+		reservoir = []
+		for i, x in enumerate( iterable ):
+			x = parse( x )
+			if i < k:
+				reservoir.append( x )
+			else:
+				j = rng.randrange( i + 1 )
+				if j < k:
+					reservoir[ j ] = x
+		return reservoir
+	print( 'algorithm R:      %.3fs' % timeit(
+	         lambda: algorithm_r(lines, 100), number=1) )
+	print( 'reservoir_sample: %.3fs' % timeit(
+	         lambda: reservoir_sample(lines, 100, parse, rng=rng), number=1) )
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# motivation.py shows product(), combinations() and
+#   combinations_with_replacement() enumerating a whole space, and
+#   powerset() and the word-finder filtering the results afterwards
+# for a search, most of that space is usually hopeless, and we can
+#   often tell from the first few elements: if the first three items
+#   already weigh more than the knapsack holds, no choice of the
+#   rest will help
+
+# these versions take a `prune' predicate, which is called on every
+#   partial tuple as it is built up
+# if prune(partial) is true, that partial tuple and everything that
+#   would have been built from it is skipped (branch and bound)
+# without prune, they produce exactly what their itertools namesakes
+#   produce, in the same order
+
+# the search can also be split across processes: every unpruned prefix
+#   of the first two elements roots an independent subtree, which is
+#   searched as a job of its own
+# (prune then has to be picklable: a module-level function, or an
+#   instance of a module-level class like Exceeds below)
+# a job's results come back from its process all at once, so the
+#   parallel search isn't bounded by one tuple the way the serial one
+#   is: it holds the results of the jobs in flight (twice as many as
+#   there are processes, collected in order), and splitting on two
+#   elements rather than one keeps each job's share small
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# offset is None for product (any index at every position), 0 for
+#   combinations_with_replacement (indices never decrease), and 1 for
+#   combinations (indices strictly increase)
+# for combinations, stop early enough that there are still enough
+#   elements left to fill the remaining positions
+def _indices( pools, r, offset, depth, last ):
+	stop = len( pools[depth] )
+	if offset is None:
+		return iter( range(stop) )
+	if offset == 1:
+		stop -= r - depth - 1
+	return iter( range(max(0, last + offset), stop) )
+
+def _search( pools, r, offset, prune, prefix=(), last=-1 ):
+	depth = len( prefix )
+	if depth == r:
+		if prune is None or not prune( prefix ):
+			yield prefix
+		return
+	indices = lambda depth, last: _indices( pools, r, offset, depth, last )
+	partial = list( prefix )
+	stack = [indices( depth, last )]
+	while stack:
+		for i in stack[-1]:
+			depth = len( partial )
+			partial.append( pools[depth][i] )
+			candidate = tuple( partial )
+			if prune is not None and prune( candidate ):
+				partial.pop()
+				continue
+			if depth + 1 == r:
+				yield candidate
+				partial.pop()
+				continue
+			stack.append( indices(depth + 1, i) )
+			break
+		else:
+			stack.pop()
+			if stack:
+				partial.pop()
+
+# (prefix, index of its last element) for every unpruned prefix of
+#   the given length, in the order the search would reach them
+def _prefixes( pools, r, offset, prune, length, prefix=(), last=-1 ):
+	if len( prefix ) == length:
+		yield prefix, last
+		return
+	depth = len( prefix )
+	for i in _indices( pools, r, offset, depth, last ):
+		candidate = prefix + (pools[depth][i],)
+		if prune is None or not prune( candidate ):
+			for x in _prefixes( pools, r, offset, prune, length, candidate, i ):
+				yield x
+
+# run in a worker process: one subtree, materialised
+def _subtree( args ):
+	return list( _search(*args) )
+
+def _parallel( pools, r, offset, prune, processes ):
+	if r < 2:
+		for x in _search( pools, r, offset, prune ):
+			yield x
+		return
+	jobs = ( (pools, r, offset, prune, prefix, last) for prefix, last in
+	         _prefixes(pools, r, offset, prune, min(2, r - 1)) )
+	processes = processes or os.cpu_count() or 1
+	with ProcessPoolExecutor( processes ) as executor:
+		pending = deque()
+		try:
+			for job in jobs:
+				pending.append( executor.submit(_subtree, job) )
+				if len( pending ) >= 2 * processes:
+					for x in pending.popleft().result():
+						yield x
+			while pending:
+				for x in pending.popleft().result():
+					yield x
+		finally:
+			for future in pending:
+				future.cancel()
+
+def _run( pools, r, offset, prune, processes ):
+	if processes is None:
+		return _search( pools, r, offset, prune )
+	return _parallel( pools, r, offset, prune, processes )
+
+def product( *iterables, repeat=1, prune=None, processes=None ):
+	pools = [tuple(x) for x in iterables] * repeat
+	return _run( pools, len(pools), None, prune, processes )
+
+def combinations( iterable, r, prune=None, processes=None ):
+	pool = tuple( iterable )
+	return _run( [pool] * r, r, 1, prune, processes )
+
+def combinations_with_replacement( iterable, r, prune=None, processes=None ):
+	pool = tuple( iterable )
+	return _run( [pool] * r, r, 0, prune, processes )
+
+# the most common kind of bound: the partial tuple is already too big
+class Exceeds( object ):
+	'''Exceeds(limit, measure=sum) prunes partial tuples with measure(partial) > limit'''
+	def __init__( self, limit, measure=sum ):
+		self.limit, self.measure = limit, measure
+	def __call__( self, partial ):
+		return self.measure( partial ) > self.limit
+
+if __name__ == '__main__':
+	import itertools
+	from timeit import default_timer as timer
+
+	# without pruning, the same as itertools
+	assert list(product(range(3), 'abcd')) == list(itertools.product(range(3), 'abcd'))
+	assert list(product(range(3), repeat=3)) == list(itertools.product(range(3), repeat=3))
+	for r in range(6):
+		assert list(combinations('abcd', r)) == \
+		       list(itertools.combinations('abcd', r))
+		assert list(combinations_with_replacement('abcd', r)) == \
+		       list(itertools.combinations_with_replacement('abcd', r))
+
+	# pruning on prefixes skips whole subtrees
+	visited = []
+	def no_leading_b( partial ):
+		visited.append( partial )
+		return partial[0] == 'b'
+	assert list(product('ab', repeat=3, prune=no_leading_b)) == \
+	       [x for x in itertools.product('ab', repeat=3) if x[0] != 'b']
+	assert len( visited ) == 1 + 2 + 4 + 1  # ('b',) is visited, its subtree isn't
+
+	# pick 6 of 40 weights that fit in a knapsack
+	weights = [3, 5, 7, 11, 13, 17, 19, 23, 29, 31] * 4
+	capacity = 40
+
+	start = timer()
+	brute = [x for x in itertools.combinations(weights, 6) if sum(x) <= capacity]
+	print( 'filter afterwards: %.3fs' % (timer() - start) )
+
+	start = timer()
+	pruned = list( combinations(weights, 6, prune=Exceeds(capacity)) )
+	print( 'prune:             %.3fs' % (timer() - start) )
+
+	start = timer()
+	parallel = list( combinations(weights, 6, prune=Exceeds(capacity), processes=2) )
+	print( 'prune (parallel):  %.3fs' % (timer() - start) )
+
+	assert brute == pruned == parallel
+
+	# the parallel search gives the same answers, in the same order
+	for r in range(5):
+		assert list(combinations('abcde', r, processes=2)) == \
+		       list(itertools.combinations('abcde', r))
+		assert list(combinations_with_replacement('abc', r, processes=2)) == \
+		       list(itertools.combinations_with_replacement('abc', r))
+		assert list(product('ab', repeat=r, processes=2)) == \
+		       list(itertools.product('ab', repeat=r))
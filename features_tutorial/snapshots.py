@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# otrace.md: trace a function, get the exception to happen again, and
+#   otrace takes a snapshot of the variables involved, which can be
+#   pickled and archived in SQLite
+# in production we can't afford to pickle the arguments of every call,
+#   and we can't afford to write to a database in the calling thread
+# so the tracer here:
+#   1. only takes a snapshot when the traced function raises, or on every
+#      nth call (sample=n), and otherwise costs a counter and a try block
+#   2. encodes the snapshot with a bounded encoder: at most `depth' levels
+#      of nesting, `width' items per container and `length' characters
+#      per string, so a snapshot of a huge object is still small
+#   3. hands the snapshot to a background thread, which inserts them into
+#      SQLite in batches (a transaction per batch, not per snapshot),
+#      using queuerouter() from batching.py to decide when a batch is due
+
+# the snapshot is encoded in the calling thread, so it shows the values
+#   as they were when the exception was raised; turning it into JSON and
+#   writing it happen in the background
+
+import json
+import sqlite3
+import threading
+from functools import wraps
+from queue import SimpleQueue
+from time import time
+
+from batching import queuerouter
+
+# ENCODING
+
+_scalars = (bool, int, float, type(None))
+
+def encode( obj, depth=3, width=20, length=200 ):
+	'''a JSON-able summary of obj, at most depth levels deep'''
+	return _encode( obj, depth, width, length, set() )
+
+def _encode( obj, depth, width, length, seen ):
+	if isinstance( obj, _scalars ):
+		return obj
+	if isinstance( obj, str ):
+		return obj if len(obj) <= length else obj[:length] + '...'
+	if isinstance( obj, (bytes, bytearray) ):
+		return repr( obj[:length] ) + ('...' if len(obj) > length else '')
+	name = type( obj ).__qualname__
+	if depth <= 0 or id( obj ) in seen:
+		return '<%s>' % name
+	seen.add( id(obj) )
+	try:
+		if isinstance( obj, dict ):
+			items = list( obj.items() )
+			rv = { str(k): _encode(v, depth - 1, width, length, seen)
+			       for k, v in items[:width] }
+			if len(items) > width:
+				rv[ '...' ] = len(items) - width
+			return rv
+		if isinstance( obj, (list, tuple, set, frozenset) ):
+			items = list( obj ) if not isinstance( obj, (list, tuple) ) else obj
+			rv = [ _encode(x, depth - 1, width, length, seen)
+			       for x in items[:width] ]
+			if len(items) > width:
+				rv.append( '... %d more' % (len(items) - width) )
+			return rv if isinstance( obj, list ) else { name: rv }
+		attrs = getattr( obj, '__dict__', None )
+		if attrs is None:
+			slots = getattr( type(obj), '__slots__', () )
+			attrs = { k: getattr(obj, k) for k in slots if hasattr(obj, k) }
+		if not attrs:
+			return _encode( repr(obj), depth, width, length, seen )
+		return { name: _encode(attrs, depth - 1, width, length, seen) }
+	finally:
+		seen.discard( id(obj) )
+
+# THE TRACER
+
+class Tracer( object ):
+	'''Tracer(path) snapshots traced functions into the SQLite database at path'''
+	def __init__( self, path, sample=None, depth=3, width=20, length=200,
+	              batch=256, max_latency=1. ):
+		self.path, self.sample = path, sample
+		self.depth, self.width, self.length = depth, width, length
+		self.batch, self.max_latency = batch, max_latency
+		self.queue = SimpleQueue()
+		self._stop = object()
+		self.written = 0
+		self._writer = threading.Thread( target=self._write,
+		                                 name='snapshots', daemon=True )
+		self._writer.start()
+
+	# encoding calls repr() and getattr() on whatever it's given, any of
+	#   which can raise; the tracer mustn't change what the traced call
+	#   does, so a snapshot that can't be taken is recorded as such
+	def _snapshot( self, func, kind, variables, error=None ):
+		try:
+			encoded = encode( variables, self.depth, self.width, self.length )
+		except Exception:
+			encoded = '<unencodable>'
+		try:
+			error = None if error is None else repr( error )
+		except Exception:
+			error = '<%s>' % type( error ).__qualname__
+		try:
+			self.queue.put( (time(), func.__qualname__, kind,
+			                 threading.current_thread().name, error, encoded) )
+		except Exception:
+			pass
+
+	def trace( self, func ):
+		'''decorator: snapshot the arguments and locals when func raises,
+		   and (with sample=n) the arguments and result of every nth call'''
+		sample = self.sample
+		calls = [0]
+		@wraps( func )
+		def wrapper( *args, **kwargs ):
+			try:
+				rv = func( *args, **kwargs )
+			except Exception as e:
+				# the frame after ours in the traceback is func's own
+				tb = e.__traceback__.tb_next
+				variables = dict( tb.tb_frame.f_locals ) if tb is not None \
+				            else { 'args': args, 'kwargs': kwargs }
+				self._snapshot( func, 'exception', variables, e )
+				raise
+			if sample is not None:
+				calls[0] += 1
+				if calls[0] >= sample:
+					calls[0] = 0
+					self._snapshot( func, 'sample', { 'args': args,
+					                'kwargs': kwargs, 'return': rv } )
+			return rv
+		return wrapper
+
+	# the background thread
+	def _write( self ):
+		conn = sqlite3.connect( self.path )
+		try:
+			conn.execute( 'CREATE TABLE IF NOT EXISTS snapshots (time real, '
+			              'function text, kind text, thread text, error text, '
+			              'variables text)' )
+			insert = 'INSERT INTO snapshots VALUES (?, ?, ?, ?, ?, ?)'
+			dumps = json.JSONEncoder( separators=(',', ':'), default=repr ).encode
+			for packet in queuerouter( self.queue, self.batch,
+			                           max_latency=self.max_latency,
+			                           sentinel=self._stop ):
+				if not packet:
+					continue
+				with conn:
+					conn.executemany( insert, [row[:5] + (dumps(row[5]),)
+					                           for row in packet] )
+				self.written += len( packet )
+		finally:
+			conn.close()
+
+	def close( self ):
+		'''write out anything still queued and stop the writer'''
+		if self._writer.is_alive():
+			self.queue.put( self._stop )
+			self._writer.join()
+	def __enter__( self ):
+		return self
+	def __exit__( self, *exc ):
+		self.close()
+
+def snapshots( path, function=None ):
+	'''read back (time, function, kind, thread, error, variables) rows'''
+	with sqlite3.connect( path ) as conn:
+		query, params = 'SELECT * FROM snapshots', ()
+		if function is not None:
+			query, params = query + ' WHERE function = ?', (function,)
+		for row in conn.execute( query + ' ORDER BY rowid', params ):
+			yield row[:5] + (json.loads(row[5]),)
+
+if __name__ == '__main__':
+	import os
+	import pickle
+	import tempfile
+	from timeit import timeit
+
+	# encoding is bounded however big the object
+	class Node( object ):
+		def __init__( self, value, next=None ):
+			self.value, self.next = value, next
+	chain = None
+	for i in range( 1000 ):
+		chain = Node( i, chain )
+	assert encode( chain, depth=3 ) == \
+	       { 'Node': { 'value': 999, 'next': { 'Node': '<dict>' } } }
+	assert encode( list(range(100)), width=3 ) == [0, 1, 2, '... 97 more']
+	assert encode( 'x' * 1000, length=5 ) == 'xxxxx...'
+	loop = []
+	loop.append( loop )
+	assert encode( loop ) == [ '<list>' ]
+
+	path = os.path.join( tempfile.mkdtemp(), 'snapshots.db' )
+	with Tracer( path, sample=100 ) as tracer:
+		@tracer.trace
+		def ratio( employees, position ):
+			salaries = [e['salary'] for e in employees if e['position'] == position]
+			return sum( salaries ) / len( salaries )
+
+		employees = [ {'name': 'janet', 'position': 'manager', 'salary': 200000},
+		              {'name': 'john',  'position': 'peon',    'salary':  20000} ]
+		assert ratio( employees, 'peon' ) == 20000
+		try:
+			ratio( employees, 'ceo' )
+		except ZeroDivisionError:
+			pass
+		else:
+			assert False
+		for _ in range( 250 ):
+			ratio( employees, 'manager' )
+	rows = list( snapshots(path, 'ratio') )
+	assert [kind for _, _, kind, _, _, _ in rows] == \
+	       [ 'exception', 'sample', 'sample' ]
+	_, _, _, thread, error, variables = rows[0]
+	assert thread == 'MainThread' and error.startswith( 'ZeroDivisionError' )
+	assert variables[ 'position' ] == 'ceo' and variables[ 'salaries' ] == []
+	assert rows[1][5][ 'return' ] == 200000
+
+	# a snapshot that can't be encoded doesn't change what the call does
+	class Broken( object ):
+		__slots__ = ()
+		def __repr__( self ):
+			raise RuntimeError( 'repr broken' )
+	with Tracer( path, sample=1 ) as tracer:
+		@tracer.trace
+		def lookup( table, key, extra ):
+			return table[ key ]
+		try:
+			lookup( {}, 'orig', Broken() )
+		except KeyError as e:
+			assert e.args == ( 'orig', )
+		else:
+			assert False
+		assert lookup( {'a': 1}, 'a', Broken() ) == 1
+	assert [ row[5] for row in snapshots(path, 'lookup') ] == \
+	       [ '<unencodable>', '<unencodable>' ]
+
+	# BENCHMARK
+	# what a traced call costs, when no snapshot is taken and when every
+	#   call is pickled and inserted the simple way
+	def plain( employees, position ):
+		salaries = [e['salary'] for e in employees if e['position'] == position]
+		return sum( salaries ) / len( salaries )
+	conn = sqlite3.connect( path + '.pickles' )
+	conn.execute( 'CREATE TABLE pickles (args blob)' )
+	def pickled( employees, position ):
+		with conn:
+			conn.execute( 'INSERT INTO pickles VALUES (?)',
+			              (pickle.dumps((employees, position)),) )
+		return plain( employees, position )
+	with Tracer( path, sample=1000 ) as tracer:
+		traced = tracer.trace( plain )
+		n = 20000
+		for label, func in (('untraced', plain), ('traced, 1 in 1000', traced),
+		                    ('pickled every call', pickled)):
+			print( '%-19s %6.2fus per call' % (label,
+			       timeit(lambda: func(employees, 'manager'), number=n) / n * 1e6) )
+	conn.close()
+	os.remove( path )
+	os.remove( path + '.pickles' )
+	os.rmdir( os.path.dirname(path) )
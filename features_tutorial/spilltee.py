@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# motivation.py introduces itertools.tee as a way to get n independent
+#   iterators from one, and notes.md calls it a `memory-efficient copy'
+# that's true while the copies are consumed at about the same pace;
+#   but tee has to keep every value that one copy has seen and another
+#   hasn't, so if one consumer races ahead (say, the other is a slow
+#   database writer), the whole gap is held in memory
+
+# this tee holds at most max_items values in memory: when the gap grows
+#   past that, the oldest half is written to a temporary file, and the
+#   lagging iterators read it back from there
+# values are pickled by default; if they are all tuples of numbers, a
+#   struct format (e.g., 'qd') gives fixed-size records that are much
+#   cheaper to write and read
+
+# the disk has to be bounded by the gap too, not by the whole stream:
+#   with a slow consumer that never quite catches up, there's never a
+#   moment when nothing on disk is needed, so we can't wait for one to
+#   start the file over
+# instead the spilled values go into a series of segment files, and a
+#   segment is closed (and its offsets forgotten) as soon as every
+#   iterator has read past it
+# a new segment is started once the current one holds max_items values
+#   and at least as many as all the older segments together, so while
+#   the gap grows the segments double in size, and there are only a
+#   handful of files open however big it gets
+
+from array import array
+from collections import deque
+from pickle import dump, load, HIGHEST_PROTOCOL
+from struct import Struct
+from tempfile import TemporaryFile
+
+class _Segment( object ):
+	'''one spill file, holding the values [first, first + count)'''
+	__slots__ = ( 'file', 'first', 'count', 'offsets', 'end' )
+	def __init__( self, first, dir ):
+		self.file = TemporaryFile( dir=dir )
+		self.first, self.count = first, 0
+		self.offsets = array( 'q' )     # pickled records only
+		self.end = 0                    # where the next record is written
+
+class _Spill( object ):
+	'''the state shared by the iterators of one tee()'''
+	def __init__( self, iterable, max_items, record, dir ):
+		self.it = iter( iterable )
+		self.max_items, self.dir = max( 2, max_items ), dir
+		self.record = None if record is None else Struct( record )
+		self.head = 0               # index of the next value from the source
+		self.memory = deque()       # values [mem_lo, head)
+		self.mem_lo = 0
+		self.segments = deque()     # values [disk_lo, mem_lo), oldest first
+		self.positions = {}         # iterator id -> index of its next value
+		self.exhausted = False
+		self.spilled = 0            # values written to disk, ever
+
+	@property
+	def disk_lo( self ):
+		return self.segments[0].first if self.segments else self.mem_lo
+
+	def _write( self, values ):
+		segments = self.segments
+		if segments:
+			current = segments[-1]
+			older = self.mem_lo - self.disk_lo - current.count
+			if current.count >= max( self.max_items, older ):
+				current = None
+		else:
+			current = None
+		if current is None:
+			current = _Segment( self.mem_lo, self.dir )
+			segments.append( current )
+		f = current.file
+		f.seek( current.end )
+		if self.record is None:
+			for x in values:
+				current.offsets.append( f.tell() )
+				dump( x, f, HIGHEST_PROTOCOL )
+		else:
+			pack = self.record.pack
+			f.write( b''.join(pack(*x) for x in values) )
+		current.end = f.tell()
+		current.count += len( values )
+		self.spilled += len( values )
+
+	def _read( self, index ):
+		for segment in self.segments:
+			if index < segment.first + segment.count:
+				break
+		f, i = segment.file, index - segment.first
+		if self.record is None:
+			f.seek( segment.offsets[i] )
+			return load( f )
+		size = self.record.size
+		f.seek( i * size )
+		return self.record.unpack( f.read(size) )
+
+	def get( self, index ):
+		if index == self.head:
+			if self.exhausted:
+				raise StopIteration
+			try:
+				x = next( self.it )
+			except StopIteration:
+				self.exhausted = True
+				raise
+			self.memory.append( x )
+			self.head += 1
+			if len(self.memory) > self.max_items:
+				self._spill()
+			return x
+		if index >= self.mem_lo:
+			return self.memory[ index - self.mem_lo ]
+		return self._read( index )
+
+	# move the oldest half of memory to disk
+	def _spill( self ):
+		n = len(self.memory) - self.max_items // 2
+		popleft = self.memory.popleft
+		self._write( [popleft() for _ in range(n)] )
+		self.mem_lo += n
+
+	# forget values every iterator has moved past
+	def trim( self ):
+		low = min( self.positions.values() ) if self.positions else self.head
+		segments = self.segments
+		while segments and segments[0].first + segments[0].count <= low:
+			segments.popleft().file.close()
+		memory = self.memory
+		while self.mem_lo < low and memory:
+			memory.popleft()
+			self.mem_lo += 1
+
+	def close( self ):
+		while self.segments:
+			self.segments.popleft().file.close()
+
+class _TeeIterator( object ):
+	def __init__( self, spill, position ):
+		self.spill = spill
+		spill.positions[ id(self) ] = position
+	def __iter__( self ):
+		return self
+	def __next__( self ):
+		spill = self.spill
+		positions = spill.positions
+		key = id( self )
+		index = positions[ key ]
+		# only the slowest iterator moving on can free anything
+		slowest = index <= min( positions.values() )
+		x = spill.get( index )
+		positions[ key ] = index + 1
+		if slowest:
+			spill.trim()
+		return x
+	def __del__( self ):
+		spill = self.spill
+		spill.positions.pop( id(self), None )
+		if spill.positions:
+			spill.trim()
+		else:
+			spill.close()
+
+def tee( iterable, n=2, max_items=10000, record=None, dir=None ):
+	'''tee(iterable, n, max_items) -> n iterators, holding at most max_items values in memory'''
+	spill = _Spill( iterable, max_items, record, dir )
+	return tuple( _TeeIterator(spill, 0) for _ in range(n) )
+
+if __name__ == '__main__':
+	from itertools import islice
+	import tracemalloc
+
+	a, b = tee( range(100), max_items=10 )
+	assert list( a ) == list( range(100) )
+	assert a.spill.spilled > 0 and len( a.spill.memory ) <= 10
+	assert list( b ) == list( range(100) )
+
+	# interleaved consumption, with fixed-size records
+	a, b, c = tee( ((i, i * .5) for i in range(1000)), 3, max_items=16, record='qd' )
+	assert list( islice(a, 500) ) == [(i, i * .5) for i in range(500)]
+	assert list( islice(b, 100) ) == [(i, i * .5) for i in range(100)]
+	assert list( a ) == [(i, i * .5) for i in range(500, 1000)]
+	assert list( b ) == [(i, i * .5) for i in range(100, 1000)]
+	assert list( c ) == [(i, i * .5) for i in range(1000)]
+
+	# an abandoned iterator doesn't pin anything
+	a, b = tee( range(1000), max_items=10 )
+	del b
+	assert list( a ) == list( range(1000) )
+	assert a.spill.spilled == 0
+
+	# a steady lag: the disk holds about the gap, not the whole stream
+	a, b = tee( range(1000000), max_items=100 )
+	most_files = most_on_disk = 0
+	for x in islice( a, 1000 ):
+		pass
+	for x, y in zip( a, b ):
+		assert x == y + 1000
+		spill = a.spill
+		most_files = max( most_files, len(spill.segments) )
+		most_on_disk = max( most_on_disk, spill.mem_lo - spill.disk_lo,
+		                    sum(len(s.offsets) for s in spill.segments) )
+	assert spill.spilled > 900000 and most_on_disk <= 4 * 1000
+	assert most_files <= 8
+	print( 'steady lag of 1000: at most %d values in %d files on disk' % (
+	       most_on_disk, most_files) )
+
+	# one iterator runs all the way ahead of the other
+	from itertools import tee as itertools_tee
+	def peak( tee, **kwargs ):
+		tracemalloc.start()
+		a, b = tee( ('record %d' % i for i in range(200000)), 2, **kwargs )
+		for _ in a:
+			pass
+		_, peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		assert sum( 1 for _ in b ) == 200000
+		return peak
+	print( 'itertools.tee peak memory: %8d bytes' % peak(itertools_tee) )
+	print( 'spilltee.tee peak memory:  %8d bytes' % peak(tee, max_items=1000) )
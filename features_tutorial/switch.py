@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# notes.md ends with a `switch' statement built out of exceptions:
+#   switch = lambda val: type('switch_meta', (type,), {})('switch',
+#                           (BaseException,), {'val': val})()
+#   case = lambda pred: type('case_meta', (type,), {'__subclasscheck__':
+#                           lambda self, obj: pred(obj.val)})('case',
+#                           (BaseException,), {})
+#   try: raise switch(x)
+#   except case(lambda x: x % 2 == 0): ...
+# it's a great demonstration of how `except' matches, but every time
+#   through it creates two new metaclasses, a new exception class per
+#   case, raises, and tests every predicate in turn
+# (it also relies on Python 2: Python 3 no longer consults
+#   __subclasscheck__ when matching an except clause)
+
+# here is the same idea -- the first matching case wins -- where cases
+#   are registered once, and then compiled into a decision list:
+#   1. runs of equality cases become a single dict lookup
+#   2. runs of range cases become a single bisect over sorted bounds
+#   3. anything else is a predicate, tested in order
+
+from bisect import bisect_right
+
+EQUALS, RANGE, PREDICATE = 'equals', 'range', 'predicate'
+
+class Switch( object ):
+	'''Switch() dispatches a value to the first matching registered case'''
+	def __init__( self ):
+		self._cases = []        # (kind, data, handler), in registration order
+		self._default = None
+		self._compiled = None
+
+	# registration
+	# each of these returns a decorator for the case's handler:
+	#   @switch.equals( 'ceo' )
+	#   def reward( employee ): ...
+	def equals( self, *values ):
+		return self._register( EQUALS, values )
+	def between( self, lo, hi ):
+		'''matches lo <= x < hi'''
+		if not lo < hi:
+			raise ValueError( 'empty range [%r, %r)' % (lo, hi) )
+		return self._register( RANGE, (lo, hi) )
+	def case( self, pred ):
+		return self._register( PREDICATE, pred )
+	def default( self, handler ):
+		self._default = handler
+		return handler
+
+	def _register( self, kind, data ):
+		def decorator( handler ):
+			self._cases.append( (kind, data, handler) )
+			self._compiled = None
+			return handler
+		return decorator
+
+	# compilation
+	def compile( self ):
+		'''build the decision list; done automatically on first dispatch'''
+		compiled = []
+		for kind, data, handler in self._cases:
+			last = compiled[-1] if compiled else None
+			if kind == EQUALS:
+				if last is None or last[0] != EQUALS:
+					last = (EQUALS, {})
+					compiled.append( last )
+				for value in data:
+					last[1].setdefault( value, handler )  # earlier cases win
+			elif kind == RANGE:
+				lo, hi = data
+				# a range joins the previous run of ranges only if it
+				#   doesn't overlap any of them; otherwise, which one
+				#   wins would depend on the order we search them in
+				if last is None or last[0] != RANGE or \
+				   any( lo < h and l < hi for l, h, _ in last[1] ):
+					last = (RANGE, [])
+					compiled.append( last )
+				last[1].append( (lo, hi, handler) )
+			else:
+				compiled.append( (PREDICATE, (data, handler)) )
+		# turn each run of ranges into parallel sorted arrays for bisect
+		for i, (kind, data) in enumerate( compiled ):
+			if kind == RANGE:
+				data.sort( key=lambda x: x[0] )
+				compiled[ i ] = (RANGE, ([lo for lo, _, _ in data],
+				                         [hi for _, hi, _ in data],
+				                         [h  for _, _, h  in data]))
+		self._compiled = compiled
+		return compiled
+
+	def match( self, value ):
+		'''the handler for value (or the default, or None)'''
+		compiled = self._compiled
+		if compiled is None:
+			compiled = self.compile()
+		for kind, data in compiled:
+			if kind is EQUALS:
+				try:
+					handler = data.get( value )
+				except TypeError:  # unhashable
+					continue
+				if handler is not None:
+					return handler
+			elif kind is RANGE:
+				los, his, handlers = data
+				try:
+					i = bisect_right( los, value ) - 1
+					if i >= 0 and value < his[i]:
+						return handlers[ i ]
+				except TypeError:  # not comparable with the bounds
+					continue
+			else:
+				pred, handler = data
+				if pred( value ):
+					return handler
+		return self._default
+
+	def __call__( self, value, *args, **kwargs ):
+		handler = self.match( value )
+		if handler is None:
+			raise LookupError( 'no case matches %r' % (value,) )
+		return handler( value, *args, **kwargs )
+
+if __name__ == '__main__':
+	from timeit import timeit
+
+	grade = Switch()
+	@grade.equals( 100 )
+	def perfect( x ):
+		return 'perfect'
+	@grade.between( 90, 100 )
+	def a( x ):
+		return 'A'
+	@grade.between( 80, 90 )
+	def b( x ):
+		return 'B'
+	@grade.case( lambda x: x < 0 )
+	def invalid( x ):
+		return 'invalid'
+	@grade.between( 0, 80 )
+	def c( x ):
+		return 'C'
+	@grade.default
+	def other( x ):
+		return 'other'
+
+	assert [grade(x) for x in (100, 95, 90, 85.5, 42, -1, 101)] == \
+	       ['perfect', 'A', 'A', 'B', 'C', 'invalid', 'other']
+	assert [kind for kind, _ in grade.compile()] == \
+	       [EQUALS, RANGE, PREDICATE, RANGE]
+
+	# the first matching case wins
+	first = Switch()
+	first.equals( 1 )( lambda x: 'one' )
+	first.equals( 1, 2 )( lambda x: 'one or two' )
+	assert first( 1 ) == 'one' and first( 2 ) == 'one or two'
+	try:
+		first( 3 )
+	except LookupError:
+		pass
+
+	# BENCHMARK
+
+	# the switch from notes.md
+	# Python 3 ignores __subclasscheck__ in except clauses, so we make
+	#   the check it relies on explicitly
+	switch = lambda val: type('switch_meta', (type,), {})('switch',
+	                        (BaseException,), {'val': val})()
+	case = lambda pred: type('case_meta', (type,), {'__subclasscheck__':
+	                        lambda self, obj: pred(obj.val)})('case',
+	                        (BaseException,), {})
+	def exception_switch( x ):
+		try:
+			raise switch( x )
+		except BaseException as e:
+			for pred, label in ((lambda x: x % 2 == 0, 'even'),
+			                    (lambda x: x % 3 == 0, 'three'),
+			                    (lambda x: True,       'other')):
+				if issubclass( type(e), case(pred) ):
+					return label
+
+	parity = Switch()
+	parity.case( lambda x: x % 2 == 0 )( lambda x: 'even' )
+	parity.case( lambda x: x % 3 == 0 )( lambda x: 'three' )
+	parity.default( lambda x: 'other' )
+
+	roles = Switch()
+	for i, role in enumerate(('ceo', 'division director', 'associate director',
+	                          'senior manager', 'manager', 'peon')):
+		roles.equals( role )( lambda x, i=i: i )
+
+	xs = list(range(1000))
+	assert [exception_switch(x) for x in xs] == [parity(x) for x in xs]
+	print( 'exception switch:    %.3fs' % timeit(
+	         lambda: [exception_switch(x) for x in xs], number=10) )
+	print( 'Switch (predicates): %.3fs' % timeit(
+	         lambda: [parity(x) for x in xs], number=10) )
+	print( 'Switch (equals):     %.3fs' % timeit(
+	         lambda: [roles('peon') for x in xs], number=10) )
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# lightning.md lists timers as a good use of context managers, and the
+#   contextmgr in syntax.py shows the shape: set up in __enter__, tear
+#   down in __exit__
+# a timer that just prints how long a block took is easy; what we want
+#   is to see where the time goes *inside* it:
+#     timer = Timer()
+#     with timer( 'request' ):
+#         with timer( 'parse' ): ...
+#         for row in rows:
+#             with timer( 'row' ): ...
+# every thread gets its own tree of sections, and a section entered
+#   again under the same parent is added to the same node (so 'row' above
+#   is one node with a count, a total, a min and a max, not a node per row)
+# the tree can be written out as JSON, or as Chrome trace events (load
+#   the file in chrome://tracing or Perfetto) to see each section on a
+#   timeline
+
+# the cost has to be close to nothing when we aren't looking:
+#   Timer(enabled=False) hands out a shared do-nothing context manager,
+#   and Timer(sample=n) only times one in every n top-level sections
+#   (and everything inside it), which keeps the numbers representative
+# an unsampled section skips the clock and the bookkeeping, but it still
+#   pays for the `with' statement and for finding its thread's state, so
+#   (see the benchmark below) it costs about 60% of a timed one, not 1/n
+
+import json
+import threading
+from functools import wraps
+from time import perf_counter_ns
+
+class _Node( object ):
+	__slots__ = ( 'name', 'children', 'count', 'total', 'min', 'max' )
+	def __init__( self, name ):
+		self.name, self.children = name, {}
+		self.count = self.total = self.max = 0
+		self.min = None
+
+	def as_dict( self ):
+		child_total = sum( c.total for c in self.children.values() )
+		return { 'name':     self.name,
+		         'count':    self.count,
+		         'total_ms': self.total / 1e6,
+		         'self_ms':  (self.total - child_total) / 1e6,
+		         'min_ms':   (self.min or 0) / 1e6,
+		         'max_ms':   self.max / 1e6,
+		         'children': [c.as_dict() for c in self.children.values()] }
+
+class _ThreadState( object ):
+	__slots__ = ( 'stack', 'skip', 'roots', 'root', 'ident', 'events' )
+	def __init__( self, max_events ):
+		self.stack = []             # (node, start) of the open sections
+		self.skip = 0               # depth inside an unsampled section
+		self.roots = -1             # top-level sections entered, less one
+		self.root = _Node( threading.current_thread().name )
+		self.ident = threading.get_ident()
+		self.events = [] if max_events else None
+
+class _Null( object ):
+	'''what a disabled Timer hands out'''
+	__slots__ = ()
+	def __enter__( self ):
+		return self
+	def __exit__( self, *exc ):
+		pass
+	def __call__( self, func ):
+		return func
+
+_null = _Null()
+
+class _Section( object ):
+	'''a named section of a Timer: a context manager and a decorator'''
+	__slots__ = ( 'timer', 'name' )
+	def __init__( self, timer, name ):
+		self.timer, self.name = timer, name
+
+	def __enter__( self ):
+		try:
+			state = self.timer._local.state
+		except AttributeError:
+			state = self.timer._state()
+		if state.skip:                          # inside an unsampled section
+			state.skip += 1
+			return self
+		stack = state.stack
+		if stack:
+			parent = stack[-1][0]
+		else:
+			state.roots += 1
+			if state.roots % self.timer.sample:
+				state.skip = 1
+				return self
+			parent = state.root
+		node = parent.children.get( self.name )
+		if node is None:
+			node = parent.children[ self.name ] = _Node( self.name )
+		stack.append( (node, perf_counter_ns()) )
+		return self
+
+	# (the clock is read after the thread's state is looked up, so that an
+	#   unsampled section doesn't read it at all; the lookup's few tens of
+	#   nanoseconds are counted in the section's time)
+	def __exit__( self, type, value, traceback ):
+		state = self.timer._local.state
+		if state.skip:
+			state.skip -= 1
+			return
+		end = perf_counter_ns()
+		node, start = state.stack.pop()
+		elapsed = end - start
+		node.count += 1
+		node.total += elapsed
+		if node.min is None or elapsed < node.min:
+			node.min = elapsed
+		if elapsed > node.max:
+			node.max = elapsed
+		events = state.events
+		if events is not None and len(events) < self.timer.max_events:
+			events.append( (node.name, start, elapsed) )
+
+	def __call__( self, func ):
+		timer = self.timer
+		@wraps( func )
+		def wrapper( *args, **kwargs ):
+			if not timer.enabled:
+				return func( *args, **kwargs )
+			with self:
+				return func( *args, **kwargs )
+		return wrapper
+
+class Timer( object ):
+	'''Timer() builds a tree of timed sections per thread: with timer('name'): ...'''
+	def __init__( self, enabled=True, sample=1, max_events=100000 ):
+		self.enabled, self.sample = enabled, max( 1, int(sample) )
+		self.max_events = max_events
+		self.start = perf_counter_ns()
+		self._sections = {}
+		self._local = threading.local()
+		self._threads = []          # the state of every thread that timed anything
+
+	def _state( self ):
+		try:
+			return self._local.state
+		except AttributeError:
+			state = self._local.state = _ThreadState( self.max_events )
+			self._threads.append( state )
+			return state
+
+	def __call__( self, name ):
+		'''a section: with timer('name'): ..., or @timer('name') / @timer'''
+		if self.enabled:
+			section = self._sections.get( name )
+			if section is not None:
+				return section
+		# (a function decorated while the timer is off is left as it is)
+		if not self.enabled:
+			return name if callable( name ) else _null
+		if callable( name ):
+			return self.section( name.__qualname__ )( name )
+		return self.section( name )
+
+	def section( self, name ):
+		section = self._sections.get( name )
+		if section is None:
+			section = self._sections[ name ] = _Section( self, name )
+		return section
+
+	# output
+	# threads can share a name, and a finished thread's ident can be
+	#   handed to a new one, so the key is the name and ident, with a
+	#   suffix if even that has been seen before
+	def as_dict( self ):
+		'''{'thread name-ident': [section tree, ...]}'''
+		trees = {}
+		for state in self._threads:
+			key = base = '%s-%d' % ( state.root.name, state.ident )
+			i = 1
+			while key in trees:
+				i += 1
+				key = '%s.%d' % ( base, i )
+			trees[ key ] = [ n.as_dict() for n in state.root.children.values() ]
+		return trees
+
+	def to_json( self, **kwargs ):
+		return json.dumps( self.as_dict(), **kwargs )
+
+	def chrome_trace( self ):
+		'''a Chrome trace-event document (for chrome://tracing or Perfetto)'''
+		events = []
+		for state in self._threads:
+			events.append( { 'name': 'thread_name', 'ph': 'M', 'pid': 1,
+			                 'tid': state.ident, 'args': {'name': state.root.name} } )
+			for name, start, elapsed in state.events or ():
+				events.append( { 'name': name, 'ph': 'X', 'pid': 1,
+				                 'tid': state.ident,
+				                 'ts':  (start - self.start) / 1e3,
+				                 'dur': elapsed / 1e3 } )
+		return { 'traceEvents': events, 'displayTimeUnit': 'ms' }
+
+	def report( self ):
+		lines = [ '%-32s %8s %12s %12s' % ('section', 'count', 'total', 'per call') ]
+		def walk( node, depth ):
+			lines.append( '%s%-*s %8d %10.3fms %10.3fms' % ('  ' * depth,
+			              30 - 2 * depth, node.name, node.count, node.total / 1e6,
+			              node.total / node.count / 1e6 if node.count else 0) )
+			for child in node.children.values():
+				walk( child, depth + 1 )
+		for state in self._threads:
+			lines.append( '[%s-%d]' % (state.root.name, state.ident) )
+			for node in state.root.children.values():
+				walk( node, 1 )
+		return '\n'.join( lines )
+
+if __name__ == '__main__':
+	from time import sleep
+	from timeit import repeat
+
+	timer = Timer()
+
+	@timer
+	def parse( row ):
+		return row.split( ',' )
+
+	def request( rows ):
+		with timer( 'request' ):
+			with timer( 'load' ):
+				sleep( .002 )
+			for row in rows:
+				with timer( 'row' ):
+					parse( row )
+
+	request( ['a,b', 'c,d', 'e,f'] )
+	request( ['g,h'] )
+	# two threads with the same name (one after the other, so the second
+	#   may well get the first's ident too) keep a tree each
+	for rows in (['x,y'], ['x,y', 'z,w']):
+		worker = threading.Thread( target=request, args=(rows,), name='worker' )
+		worker.start()
+		worker.join()
+
+	tree = timer.as_dict()
+	def trees( tree, name ):
+		return [ tree[key] for key in sorted(tree) if key.startswith(name + '-') ]
+	[[main]] = trees( tree, 'MainThread' )
+	assert main[ 'name' ] == 'request' and main[ 'count' ] == 2
+	load, row = main[ 'children' ]
+	assert load[ 'count' ] == 2 and load[ 'min_ms' ] >= 2
+	assert row[ 'count' ] == 4 and row[ 'children' ][0][ 'name' ] == 'parse'
+	assert row[ 'children' ][0][ 'count' ] == 4
+	assert main[ 'total_ms' ] >= load[ 'total_ms' ] + row[ 'total_ms' ]
+	workers = trees( tree, 'worker' )
+	assert sorted( w[0]['children'][1]['count'] for w in workers ) == [1, 2]
+	assert json.loads( timer.to_json() ) == tree
+
+	trace = timer.chrome_trace()[ 'traceEvents' ]
+	spans = [ e for e in trace if e['ph'] == 'X' ]
+	assert len( spans ) == (2 + 2 + 4 + 4) + (1 + 1 + 1 + 1) + (1 + 1 + 2 + 2)
+	# everything that starts inside the first request ends inside it too
+	first = min( (e for e in spans if e['name'] == 'request'), key=lambda e: e['ts'] )
+	inside = [ e for e in spans if e['tid'] == first['tid'] and
+	           first['ts'] <= e['ts'] < first['ts'] + first['dur'] ]
+	assert len( inside ) == 1 + 1 + 3 + 3
+	assert all( e['ts'] + e['dur'] <= first['ts'] + first['dur'] for e in inside )
+
+	# sampling: one top-level section in ten, with everything inside it
+	sampled = Timer( sample=10 )
+	for i in range( 100 ):
+		with sampled( 'outer' ):
+			with sampled( 'inner' ):
+				pass
+	[[outer]] = trees( sampled.as_dict(), 'MainThread' )
+	assert outer[ 'count' ] == 10 and outer[ 'children' ][0][ 'count' ] == 10
+
+	# disabled: nothing is recorded at all
+	off = Timer( enabled=False )
+	with off( 'outer' ):
+		pass
+	assert off.as_dict() == {} and off( parse ) is parse
+
+	print( timer.report() )
+
+	# BENCHMARK
+	n = 200000
+	def bare():
+		pass
+	def timed( timer ):
+		def block():
+			with timer( 'block' ):
+				pass
+		return block
+	best = lambda func: min( repeat(func, number=n, repeat=5) ) / n * 1e6
+	print( 'no timer:     %.3fus' % best(bare) )
+	for label, t in (('disabled:', Timer(enabled=False)),
+	                 ('sample=100:', Timer(sample=100)),
+	                 ('enabled:', Timer(max_events=0)),
+	                 ('with events:', Timer(max_events=5 * n))):
+		print( '%-13s %.3fus' % (label, best(timed(t))) )
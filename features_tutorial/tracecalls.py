@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# lightning.md mentions a `tracecalls' class decorator, which prints a
+#   line every time an attribute of the class is used
+# printing (and formatting a message) on every call is far too slow
+#   to leave on in a server, and the output is of little use in bulk
+# instead, @tracecalls swaps every method, classmethod, staticmethod and
+#   property defined on the class for a wrapper that counts its calls
+#   and adds up their time, in arrays allocated when the class is
+#   decorated: slot i of counts and nanoseconds belongs to the i-th
+#   attribute, so a call costs two clock reads and two array updates
+# callstats(cls).disable() puts the original functions back in the
+#   class's __dict__, so a disabled class is the same as an undecorated
+#   one and costs nothing; enable() puts the wrappers back
+
+# (only attributes defined on the class itself are wrapped: inherited
+#   methods aren't, and plain instance attributes aren't either, since
+#   catching those would take a __getattribute__ that slows down every
+#   attribute lookup on the object; other descriptors, like slots or a
+#   cached_property, are left alone too)
+# (the counters take no lock, so with several threads calling the same
+#   method at once, an update can occasionally be lost)
+
+from array import array
+from functools import wraps
+from time import perf_counter_ns
+from types import FunctionType
+from weakref import WeakKeyDictionary
+
+def _timed( func, i, counts, nanoseconds ):
+	@wraps( func )
+	def wrapper( *args, **kwargs ):
+		start = perf_counter_ns()
+		try:
+			return func( *args, **kwargs )
+		finally:
+			nanoseconds[ i ] += perf_counter_ns() - start
+			counts[ i ] += 1
+	return wrapper
+
+class CallStats( object ):
+	'''per-attribute call counts and times for a class decorated with @tracecalls'''
+	def __init__( self, cls, exclude=() ):
+		self.cls = cls
+		self.originals, wrap = {}, []
+		for name, value in list( vars(cls).items() ):
+			if name in exclude:
+				continue
+			if isinstance( value, (staticmethod, classmethod) ):
+				wrap.append( (name, value.__func__, type(value)) )
+			elif isinstance( value, property ):
+				wrap.append( (name, value, property) )
+			elif isinstance( value, FunctionType ):
+				wrap.append( (name, value, None) )
+			elif callable( value ) and not isinstance( value, type ) and \
+			     not hasattr( type(value), '__get__' ):
+				# a builtin, a partial or a callable instance isn't bound
+				#   to the instance it's looked up on, and our wrapper (a
+				#   function) would be: staticmethod keeps it unbound
+				wrap.append( (name, value, staticmethod) )
+			else:
+				continue
+			self.originals[ name ] = value
+		# one slot per function: a property has a slot for each accessor
+		slots = []
+		for name, func, kind in wrap:
+			if kind is property:
+				slots.extend( '%s.%s' % (name, accessor)
+				              for accessor in ('get', 'set', 'delete')
+				              if getattr(func, 'f' + accessor[:3]) is not None )
+			else:
+				slots.append( name )
+		self.names = slots
+		self.counts = array( 'Q', [0] * len(slots) )
+		self.nanoseconds = array( 'Q', [0] * len(slots) )
+		self.wrappers = {}
+		index = { name: i for i, name in enumerate(slots) }
+		timed = lambda func, slot: _timed( func, index[slot], self.counts,
+		                                   self.nanoseconds )
+		for name, func, kind in wrap:
+			if kind is property:
+				accessors = [ timed(f, '%s.%s' % (name, a)) if f is not None else None
+				              for f, a in ((func.fget, 'get'), (func.fset, 'set'),
+				                           (func.fdel, 'delete')) ]
+				self.wrappers[ name ] = property( *accessors, doc=func.__doc__ )
+			elif kind is not None:
+				self.wrappers[ name ] = kind( timed(func, name) )
+			else:
+				self.wrappers[ name ] = timed( func, name )
+		self.enabled = False
+
+	def enable( self ):
+		for name, wrapper in self.wrappers.items():
+			setattr( self.cls, name, wrapper )
+		self.enabled = True
+	def disable( self ):
+		for name, original in self.originals.items():
+			setattr( self.cls, name, original )
+		self.enabled = False
+
+	def reset( self ):
+		for i in range( len(self.names) ):
+			self.counts[ i ] = self.nanoseconds[ i ] = 0
+
+	def as_dict( self ):
+		'''{attribute: (calls, seconds)}'''
+		return { name: (self.counts[i], self.nanoseconds[i] / 1e9)
+		         for i, name in enumerate(self.names) }
+
+	def report( self ):
+		rows = sorted( self.as_dict().items(), key=lambda x: x[1][1], reverse=True )
+		lines = [ '%-30s %10s %12s %12s' % ('attribute', 'calls', 'total ms',
+		                                    'per call us') ]
+		for name, (calls, seconds) in rows:
+			if calls:
+				lines.append( '%-30s %10d %12.3f %12.3f' % (name, calls,
+				              seconds * 1e3, seconds / calls * 1e6) )
+		return '\n'.join( lines )
+
+_stats = WeakKeyDictionary()
+
+def tracecalls( cls=None, enabled=True, exclude=() ):
+	'''@tracecalls or @tracecalls(enabled=False, exclude=('__repr__',))'''
+	def decorator( cls ):
+		stats = _stats[ cls ] = CallStats( cls, exclude )
+		if enabled:
+			stats.enable()
+		return cls
+	return decorator if cls is None else decorator( cls )
+
+def callstats( cls ):
+	'''the CallStats of a class decorated with @tracecalls'''
+	return _stats[ cls ]
+
+if __name__ == '__main__':
+	import io
+	from functools import partial
+	from timeit import timeit
+
+	@tracecalls
+	class Account( object ):
+		rate = .05
+		def __init__( self, balance ):
+			self._balance = balance
+		def deposit( self, amount ):
+			self._balance += amount
+		@property
+		def balance( self ):
+			'''the current balance'''
+			return self._balance
+		@balance.setter
+		def balance( self, value ):
+			self._balance = value
+		@classmethod
+		def empty( cls ):
+			return cls( 0 )
+		@staticmethod
+		def interest( amount ):
+			return amount * Account.rate
+		size = len
+		tag = partial( str.upper, 'x' )
+
+	account = Account.empty()
+	for _ in range( 10 ):
+		account.deposit( 10 )
+	account.balance = account.balance + 1
+	assert account.balance == 101 and Account.interest( 100 ) == 5
+	assert Account.__dict__[ 'balance' ].__doc__ == 'the current balance'
+	assert account.size( 'abc' ) == 3 and account.tag() == 'X'
+	stats = callstats( Account )
+	calls = { name: n for name, (n, _) in stats.as_dict().items() }
+	assert calls == { '__init__': 1, 'deposit': 10, 'balance.get': 2,
+	                  'balance.set': 1, 'empty': 1, 'interest': 1,
+	                  'size': 1, 'tag': 1 }
+	assert stats.as_dict()[ 'deposit' ][1] > 0
+
+	# off: the class dict holds the original objects again
+	stats.disable()
+	assert Account.__dict__[ 'deposit' ] is stats.originals[ 'deposit' ]
+	assert all( vars(Account)[name] is value
+	            for name, value in stats.originals.items() )
+	account.deposit( 1 )
+	assert stats.as_dict()[ 'deposit' ][0] == 10
+	stats.enable()
+	account.deposit( 1 )
+	assert stats.as_dict()[ 'deposit' ][0] == 11
+	assert account.balance == 103
+
+	# BENCHMARK
+	class Plain( object ):
+		def deposit( self, amount ):
+			pass
+	class Printing( object ):
+		# the lightning talk's version, printing to a throwaway stream
+		def __getattribute__( self, name ):
+			print( 'accessing %s' % name, file=sink )
+			return object.__getattribute__( self, name )
+		def deposit( self, amount ):
+			pass
+	Traced = tracecalls( type('Traced', (Plain,), {'deposit': Plain.deposit}) )
+	sink = io.StringIO()
+	n = 200000
+	for label, obj in (('plain', Plain()), ('printing', Printing()),
+	                   ('traced', Traced())):
+		print( '%-18s %.3fus per call' % (label,
+		       timeit(lambda: obj.deposit(1), number=n) / n * 1e6) )
+	callstats( Traced ).disable()
+	obj = Traced()
+	print( '%-18s %.3fus per call' % ('traced, disabled',
+	       timeit(lambda: obj.deposit(1), number=n) / n * 1e6) )
+	print( stats.report() )
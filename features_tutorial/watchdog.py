@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# guided_debugging.md catches code that runs too long with
+#   signal.alarm(30); do_something(); signal.alarm(0)
+# but alarm() only counts whole seconds, there is only one alarm per
+#   process, and the signal is always handled by the main thread
+# here, every `with watchdog(deadline):' block (in any thread) puts a
+#   timer on a heap shared by a single monitor thread, which sleeps until
+#   the earliest deadline
+# if a block is still running when its deadline passes, the monitor
+#   grabs that thread's stack from sys._current_frames() and reports it,
+#   while the block carries on (we only watch; we don't interrupt)
+# every block's run time also goes into a histogram, so we can see how
+#   close to the deadline things usually run
+
+# leaving a block doesn't touch the heap or wake the monitor: it just
+#   marks its timer inactive, and the monitor throws inactive timers away
+#   as they come to the top (or all at once, if too many pile up)
+
+# the monitor is a Python thread, so it needs the GIL to notice anything;
+#   a thread busy running Python code only offers the GIL up every
+#   sys.getswitchinterval() seconds (5ms by default), so for deadlines
+#   finer than that, lower the switch interval too
+
+import sys
+import threading
+from array import array
+from collections import namedtuple
+from functools import wraps
+from heapq import heapify, heappop, heappush
+from itertools import count
+from time import perf_counter
+from traceback import format_stack
+
+class _Timer( object ):
+	__slots__ = ( 'watchdog', 'start', 'deadline', 'ident', 'active' )
+	def __init__( self, watchdog, start, deadline, ident ):
+		self.watchdog, self.start, self.deadline = watchdog, start, deadline
+		self.ident, self.active = ident, True
+
+class _Monitor( object ):
+	'''the one thread that watches the deadlines of every watchdog'''
+	def __init__( self ):
+		self.heap = []              # (deadline, sequence, timer)
+		self.sequence = count()
+		self.condition = threading.Condition()
+		self.thread = None
+		self.limit = 64             # compact the heap when it gets this big
+
+	def add( self, timer ):
+		with self.condition:
+			if self.thread is None:
+				self.thread = threading.Thread( target=self._run,
+				                                name='watchdog', daemon=True )
+				self.thread.start()
+			heap = self.heap
+			if len(heap) >= self.limit:
+				heap[:] = [x for x in heap if x[2].active]
+				heapify( heap )
+				self.limit = max( 64, 2 * len(heap) )
+			heappush( heap, (timer.deadline, next(self.sequence), timer) )
+			# only a new earliest deadline means the monitor should wake
+			#   up sooner than it planned to
+			if heap[0][2] is timer:
+				self.condition.notify()
+
+	def _run( self ):
+		heap, condition = self.heap, self.condition
+		with condition:
+			while True:
+				while heap and not heap[0][2].active:
+					heappop( heap )
+				if not heap:
+					condition.wait()
+					continue
+				delay = heap[0][0] - perf_counter()
+				if delay > 0:
+					condition.wait( delay )
+					continue
+				timer = heappop( heap )[2]
+				frame = sys._current_frames().get( timer.ident )
+				condition.release()
+				try:
+					if timer.active:
+						timer.watchdog._expired( timer, frame )
+				finally:
+					frame = None
+					condition.acquire()
+
+_monitor = _Monitor()
+
+# HISTOGRAM
+
+class Histogram( object ):
+	'''counts of durations in power-of-two buckets of microseconds:
+	   bucket i holds durations of [2**(i-1), 2**i) microseconds'''
+	def __init__( self ):
+		self.counts = array( 'L', [0] * 40 )
+		self.lock = threading.Lock()
+	def add( self, seconds ):
+		i = min( int(seconds * 1e6).bit_length(), 39 )
+		with self.lock:
+			self.counts[ i ] += 1
+	def total( self ):
+		return sum( self.counts )
+	def percentile( self, p ):
+		'''the upper bound, in seconds, of the bucket holding percentile p'''
+		target, seen = p / 100. * self.total(), 0
+		for i, n in enumerate( self.counts ):
+			seen += n
+			if n and seen >= target:
+				return 2**i / 1e6
+		return 0.
+	def __str__( self ):
+		lines = []
+		for i, n in enumerate( self.counts ):
+			if n:
+				lines.append( '< %10.3fms %8d' % (2**i / 1e3, n) )
+		return '\n'.join( lines )
+
+# WATCHDOG
+
+Timeout = namedtuple( 'Timeout', 'name thread deadline late stack' )
+
+def print_timeout( timeout ):
+	print( 'watchdog %s: %s has run past its %.3fms deadline\n%s' % (
+	       timeout.name, timeout.thread, timeout.deadline * 1e3,
+	       ''.join(timeout.stack)), file=sys.stderr )
+
+class watchdog( object ):
+	'''watchdog(deadline) reports blocks (or calls) running longer than deadline'''
+	def __init__( self, deadline, name=None, on_timeout=print_timeout ):
+		self.deadline, self.name = deadline, name
+		self.on_timeout = on_timeout
+		self.histogram = Histogram()
+		self.timeouts = 0
+		self._local = threading.local()
+
+	def __enter__( self ):
+		try:
+			timers = self._local.timers
+		except AttributeError:
+			timers = self._local.timers = []
+		start = perf_counter()
+		timer = _Timer( self, start, start + self.deadline, threading.get_ident() )
+		timers.append( timer )
+		_monitor.add( timer )
+		return self
+
+	def __exit__( self, *exc ):
+		timer = self._local.timers.pop()
+		timer.active = False
+		self.histogram.add( perf_counter() - timer.start )
+
+	def __call__( self, func ):
+		if self.name is None:
+			self.name = func.__qualname__
+		@wraps( func )
+		def wrapper( *args, **kwargs ):
+			with self:
+				return func( *args, **kwargs )
+		return wrapper
+
+	# called from the monitor thread
+	def _expired( self, timer, frame ):
+		self.timeouts += 1
+		thread = next( (t.name for t in threading.enumerate()
+		                if t.ident == timer.ident), str(timer.ident) )
+		stack = format_stack( frame ) if frame is not None else []
+		late = perf_counter() - timer.deadline
+		self.on_timeout( Timeout(self.name, thread, self.deadline, late, stack) )
+
+if __name__ == '__main__':
+	from time import sleep
+	from timeit import timeit
+
+	def spin( seconds ):
+		end = perf_counter() + seconds
+		while perf_counter() < end:
+			pass
+
+	# sub-millisecond deadlines, in many threads at once
+	sys.setswitchinterval( .0001 )
+	reports = []
+	watched = watchdog( .0005, 'section', on_timeout=reports.append )
+	def worker( i ):
+		for j in range( 20 ):
+			with watched:
+				spin( .005 if (i, j) == (3, 7) else .00005 )
+	threads = [threading.Thread(target=worker, args=(i,), name='worker-%d' % i)
+	           for i in range(8)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	assert watched.timeouts >= 1
+	assert any( r.thread == 'worker-3' and 'spin' in r.stack[-1] for r in reports )
+	assert watched.histogram.total() == 160
+	assert watched.histogram.percentile( 50 ) < .0005 <= watched.histogram.percentile( 100 )
+
+	# as a decorator; calls that finish in time aren't reported
+	reports = []
+	@watchdog( .01, on_timeout=reports.append )
+	def slow( seconds ):
+		sleep( seconds )
+	for _ in range( 100 ):
+		slow( 0 )
+	slow( .03 )
+	sleep( .01 )
+	# (allowing for the odd scheduling hiccup on a busy machine)
+	assert 1 <= len( reports ) < 5 and reports[-1].name == 'slow'
+	assert 'in slow' in reports[-1].stack[-1]
+
+	# how late the monitor notices, and how cheap an unexceeded block is
+	reports = []
+	late = watchdog( .0002, on_timeout=reports.append )
+	for _ in range( 50 ):
+		with late:
+			spin( .001 )
+	lateness = sorted( r.late for r in reports )
+	print( 'timeouts noticed:  %d of 50, median %.3fms after the deadline' % (
+	       len(lateness), lateness[len(lateness) // 2] * 1e3) )
+	print( 'section latencies:\n%s' % watched.histogram )
+	quiet = watchdog( 10 )
+	def watched_block():
+		with quiet:
+			pass
+	n = 100000
+	print( 'empty block:       %.2fus' % (timeit('pass', number=n) / n * 1e6) )
+	print( 'watched block:     %.2fus' % (timeit(watched_block, number=n) / n * 1e6) )
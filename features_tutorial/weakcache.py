@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+
+# lightning.md: weakref.ref() can call a callback when the object it
+#   refers to is about to die, which makes it a good fit for caching
+# the things worth caching are usually derived from some other object:
+#   the market value of a portfolio, an index over an employee table
+# we want the derived value to live exactly as long as its source, so
+#   the cache mustn't keep the source alive, and mustn't hold on to the
+#   derived value once the source is gone
+
+# a WeakCache is keyed on the identity of the source object, and holds
+#   only a weak reference to it; the reference's callback drops the entry
+#   when the source dies (keying on id() rather than on the object, as
+#   WeakKeyDictionary does, means sources needn't be hashable, and a
+#   mutable source usually isn't)
+# a source that changes in place can't be noticed by the cache, so each
+#   entry also records the source's version when the value was computed:
+#   Versioned objects bump their version whenever an attribute is set, and
+#   touch() bumps it for changes the object can't see (like appending to
+#   a list it holds); a stale entry is recomputed on the next lookup
+# a source has to be something we can take a weak reference to: an
+#   instance of a class of our own is, but the built-in tuples, lists and
+#   dicts aren't (nor are namedtuples like the Stock tuples motivation.py
+#   builds its portfolio from), so they need wrapping in a class first,
+#   like Portfolio below; anything else raises a TypeError saying so
+
+from functools import update_wrapper
+from itertools import count
+from weakref import ref
+
+_versions = count( 1 )
+
+class Versioned( object ):
+	'''a base class whose instances carry a version, bumped on every change'''
+	_version = 0
+	def __setattr__( self, name, value ):
+		object.__setattr__( self, name, value )
+		object.__setattr__( self, '_version', next(_versions) )
+	def touch( self ):
+		'''note a change that didn't go through attribute assignment'''
+		object.__setattr__( self, '_version', next(_versions) )
+
+def version( obj ):
+	return getattr( obj, '_version', 0 )
+
+class WeakCache( object ):
+	'''WeakCache(func) caches func(source, *args) for as long as source lives'''
+	def __init__( self, func ):
+		update_wrapper( self, func )
+		self.func = func
+		self.entries = {}           # id(source) -> (weakref, {args: (version, value)})
+		self.hits = self.misses = 0
+
+	def __call__( self, source, *args ):
+		key = id( source )
+		entry = self.entries.get( key )
+		if entry is None:
+			try:
+				weak = ref( source, self._remover(key) )
+			except TypeError:
+				raise TypeError( '%s() caches values for objects that can be '
+				                 'weakly referenced, and %s objects can\'t be: '
+				                 'wrap them in a class of your own' % (
+				                 self.__name__, type(source).__name__) ) from None
+			entry = self.entries[ key ] = ( weak, {} )
+		values = entry[1]
+		stamp = version( source )
+		try:
+			cached_stamp, value = values[ args ]
+			if cached_stamp == stamp:
+				self.hits += 1
+				return value
+		except KeyError:
+			pass
+		self.misses += 1
+		value = self.func( source, *args )
+		values[ args ] = ( stamp, value )
+		return value
+
+	def _remover( self, key ):
+		# the callback mustn't keep the cache alive
+		selfref = ref( self )
+		def remove( _ ):
+			cache = selfref()
+			if cache is not None:
+				cache.entries.pop( key, None )
+		return remove
+
+	def invalidate( self, source=None ):
+		'''forget the values for source (or for everything)'''
+		if source is None:
+			self.entries.clear()
+		else:
+			self.entries.pop( id(source), None )
+
+	def __len__( self ):
+		return len( self.entries )
+
+def cached( func ):
+	'''decorator: @cached def valuation( portfolio ): ...'''
+	return WeakCache( func )
+
+if __name__ == '__main__':
+	import gc
+	from collections import namedtuple
+	from timeit import timeit
+
+	Stock = namedtuple( 'Stock', 'ticker sector price volume' )
+
+	class Portfolio( Versioned ):
+		def __init__( self, stocks ):
+			self.stocks = list( stocks )
+		def add( self, stock ):
+			self.stocks.append( stock )
+			self.touch()
+
+	@cached
+	def market_value( portfolio ):
+		return sum( x.price * x.volume for x in portfolio.stocks )
+
+	@cached
+	def by_sector( portfolio, sector ):
+		return [ x.ticker for x in portfolio.stocks if x.sector == sector ]
+
+	portfolio = Portfolio(( Stock('ADBE',  'infotech',     31.5,  870),
+	                        Stock('AET',   'health',       42.4,  540),
+	                        Stock('AGN',   'health',       90.8,  830),
+	                        Stock('BRK.B', 'financials',   80.0,  630),
+	                        Stock('BA',    'industrials',  68.4,  310),
+	                        Stock('CPB',   'consumer',     31.6,  250),
+	                        Stock('CAT',   'industrials',  86.2,  670),
+	                        Stock('F',     'consumer',     10.5,  540),
+	                        Stock('GOOG',  'infotech',    579.8,  350),
+	                        Stock('XOM',   'energy',       79.3,  610) ))
+	assert market_value.__name__ == 'market_value'
+	for unreferenceable in ( tuple(portfolio.stocks), portfolio.stocks, {} ):
+		try:
+			market_value( unreferenceable )
+		except TypeError as e:
+			assert 'weakly referenced' in str( e )
+		else:
+			assert False
+	assert len( market_value ) == 0
+
+	value = market_value( portfolio )
+	assert market_value( portfolio ) == value
+	assert (market_value.hits, market_value.misses) == (1, 1)
+	assert by_sector( portfolio, 'health' ) == [ 'AET', 'AGN' ]
+	assert by_sector( portfolio, 'energy' ) == [ 'XOM' ]
+	assert len( by_sector.entries[id(portfolio)][1] ) == 2
+
+	# changing the source makes the cached values stale
+	portfolio.add( Stock('XOM2', 'energy', 10., 100) )
+	assert market_value( portfolio ) == value + 1000
+	assert by_sector( portfolio, 'energy' ) == [ 'XOM', 'XOM2' ]
+	portfolio.stocks = portfolio.stocks[:1]
+	assert market_value( portfolio ) == 31.5 * 870
+
+	# explicit invalidation
+	market_value.invalidate( portfolio )
+	assert market_value( portfolio ) == 31.5 * 870 and market_value.misses == 4
+
+	# the cache doesn't keep the portfolio alive, and forgets it when it dies
+	source = ref( portfolio )
+	del portfolio
+	gc.collect()
+	assert source() is None
+	assert len( market_value ) == 0 and len( by_sector ) == 0
+
+	# an unhashable source, without a version: only death invalidates
+	class Table( object ):
+		__hash__ = None
+		def __init__( self, rows ):
+			self.rows = rows
+	@cached
+	def index( table, column ):
+		return { row[column]: row for row in table.rows }
+	table = Table( [('janet', 200000), ('john', 400000)] )
+	assert index( table, 0 )[ 'john' ] == ('john', 400000)
+	assert index( table, 0 ) is index( table, 0 )
+	del table
+	assert len( index ) == 0
+
+	# BENCHMARK
+	portfolio = Portfolio( Stock('T%d' % i, 'sector%d' % (i % 10), i, i)
+	                       for i in range(10000) )
+	uncached = market_value.__wrapped__
+	n = 200
+	print( 'market value, recomputed: %8.2fus' % (
+	       timeit(lambda: uncached(portfolio), number=n) / n * 1e6) )
+	print( 'market value, cached:     %8.2fus' % (
+	       timeit(lambda: market_value(portfolio), number=n) / n * 1e6) )